@@ -1,64 +1,115 @@
 #!/usr/bin/env python3
 """
 Stock History Checker - Run this anytime to see recorded stock events
+
+Examples:
+  python check_history.py report
+  python check_history.py query --since 12h --denom 1000 --format csv
+  python check_history.py query --status IN_STOCK --follow
+  python check_history.py export --since 2026-10-01
 """
 
+import argparse
+import csv
 import json
 import os
-from datetime import datetime, timedelta, timezone
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from main import IRAQ_OFFSET, query_history
 
 HISTORY_FILE = 'stock_history.json'
+FOLLOW_INTERVAL = 2
 
 def iraq_now():
     """Get current time in Iraq (UTC+3)"""
     utc_now = datetime.now(timezone.utc)
-    return utc_now + timedelta(hours=3)
+    return utc_now + IRAQ_OFFSET
+
+def parse_time_arg(value):
+    """Parse '12h' / '30m' / '2d' (ago) or an Iraq-time date like '2026-10-19 14:00' to epoch"""
+    relative = re.fullmatch(r'(\d+)([mhd])', value.strip())
+    if relative:
+        amount, unit = int(relative.group(1)), relative.group(2)
+        seconds = amount * {'m': 60, 'h': 3600, 'd': 86400}[unit]
+        return int(time.time()) - seconds
+    try:
+        stamp = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time: {value!r} (use 12h, 2d or YYYY-MM-DD[ HH:MM])")
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc) - IRAQ_OFFSET
+    return int(stamp.timestamp())
+
+def event_time(event):
+    """Stored timestamps are already Iraq wall time"""
+    return datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
+
+def event_epoch(event):
+    return int((event_time(event) - IRAQ_OFFSET).timestamp())
+
+def load_events(args):
+    """Load events in the requested window via the on-disk index, then filter"""
+    events = query_history(args.file, since=args.since, until=args.until)
+    if args.denom:
+        events = [e for e in events if e.get('denomination') in args.denom]
+    if args.status:
+        events = [e for e in events if e.get('status') == args.status]
+    return events
+
+def print_events(events, fmt, writer=None):
+    if fmt == 'json':
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+    elif fmt == 'csv':
+        for event in events:
+            writer.writerow([event.get('timestamp'), event.get('denomination'), event.get('status'),
+                             event.get('price'), event.get('product')])
+    else:
+        for event in events:
+            emoji = "🟢" if event.get('status') == 'IN_STOCK' else "🔴"
+            print(f"{event_time(event).strftime('%d/%m/%Y %H:%M:%S')}  {emoji} "
+                  f"₹{event.get('denomination', '?'):<5} {event.get('status', 'Unknown'):<10} "
+                  f"{event.get('price', 'Unknown'):<18} {event.get('product', 'Unknown')}")
+    sys.stdout.flush()
 
-def check_history():
+def check_history(args):
     """Check and display stock history"""
-    
+
     print("\n" + "="*60)
     print("📊 STOCK HISTORY REPORT 📊".center(60))
     print("="*60)
     print(f"📅 Generated: {iraq_now().strftime('%d/%m/%Y %I:%M:%S %p')} Iraq Time")
     print("="*60 + "\n")
-    
-    if not os.path.exists(HISTORY_FILE):
+
+    if not os.path.exists(args.file):
         print("❌ No history file found!")
         print("\nThis means:")
         print("  • Bot was just deployed")
         print("  • No stock events have occurred yet")
         print("  • Everything is working normally!")
         return
-    
+
     try:
-        with open(HISTORY_FILE, 'r') as f:
-            events = json.load(f)
-        
+        events = load_events(args)
+
         if not events:
             print("📊 No stock events recorded yet.")
             print("Bot is waiting for first stock appearance!")
             return
-        
+
         print(f"📊 Total events recorded: {len(events)}")
-        
-        # Get date range
-        first_event = datetime.fromisoformat(events[-1]['timestamp'].replace('Z', '+00:00'))
-        last_event = datetime.fromisoformat(events[0]['timestamp'].replace('Z', '+00:00'))
-        
-        # Convert to Iraq time
-        first_iraq = first_event.replace(tzinfo=timezone.utc) + timedelta(hours=3)
-        last_iraq = last_event.replace(tzinfo=timezone.utc) + timedelta(hours=3)
-        
-        print(f"📅 First event: {first_iraq.strftime('%d/%m/%Y %H:%M')} Iraq")
-        print(f"📅 Last event: {last_iraq.strftime('%d/%m/%Y %H:%M')} Iraq")
+        print(f"📅 First event: {event_time(events[0]).strftime('%d/%m/%Y %H:%M')} Iraq")
+        print(f"📅 Last event: {event_time(events[-1]).strftime('%d/%m/%Y %H:%M')} Iraq")
         print("")
-        
+
         # Stats by denomination
         print("💰 STATISTICS BY DENOMINATION")
         print("-"*40)
-        
-        from collections import defaultdict
+
         by_denom = defaultdict(lambda: {'total': 0, 'in': 0, 'out': 0})
         for e in events:
             denom = e.get('denomination', 'Unknown')
@@ -67,85 +118,133 @@ def check_history():
                 by_denom[denom]['in'] += 1
             elif e.get('status') == 'OUT_STOCK':
                 by_denom[denom]['out'] += 1
-        
+
         for denom in sorted(by_denom.keys(), key=lambda x: int(x) if x.isdigit() else 0):
             stats = by_denom[denom]
             print(f"  • ₹{denom}:")
             print(f"    • Total: {stats['total']}")
             print(f"    • 🟢 IN: {stats['in']} | 🔴 OUT: {stats['out']}")
         print("")
-        
-        # Recent events
+
+        # Recent events, newest first
         print("📋 RECENT EVENTS (Last 10)")
         print("-"*40)
-        
-        for i, event in enumerate(events[:10], 1):
-            event_time = datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
-            event_iraq = event_time.replace(tzinfo=timezone.utc) + timedelta(hours=3)
-            time_str = event_iraq.strftime('%d/%m %H:%M')
+
+        for i, event in enumerate(reversed(events[-10:]), 1):
+            time_str = event_time(event).strftime('%d/%m %H:%M')
             emoji = "🟢" if event.get('status') == 'IN_STOCK' else "🔴"
-            
+
             print(f"\n  {emoji} Event #{i}:")
             print(f"    • Denomination: ₹{event.get('denomination', 'Unknown')}")
             print(f"    • Status: {event.get('status', 'Unknown')}")
             print(f"    • Time: {time_str} Iraq")
             print(f"    • Price: {event.get('price', 'Unknown')}")
-        
+
         print("\n" + "="*60)
         print("✅ Report Complete".center(60))
         print("="*60)
-        
+
     except Exception as e:
         print(f"❌ Error reading history: {e}")
 
-def export_history():
+def query(args):
+    """Print matching events, optionally tailing new ones as they are saved"""
+    writer = csv.writer(sys.stdout) if args.format == 'csv' else None
+    if writer:
+        writer.writerow(['timestamp', 'denomination', 'status', 'price', 'product'])
+
+    events = load_events(args)
+    if args.limit:
+        events = events[-args.limit:]
+    print_events(events, args.format, writer)
+    if not args.follow:
+        return
+
+    last_ts = event_epoch(events[-1]) if events else int(time.time())
+    last_stat = None
+    try:
+        while True:
+            try:
+                st = os.stat(args.file)
+                stat_key = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                stat_key = None
+            if stat_key and stat_key != last_stat:
+                args.since = last_ts + 1
+                try:
+                    new_events = load_events(args)
+                except ValueError:
+                    # Caught the bot mid-save; try again on the next tick
+                    new_events = None
+                else:
+                    last_stat = stat_key
+                if new_events:
+                    print_events(new_events, args.format, writer)
+                    last_ts = event_epoch(new_events[-1])
+            time.sleep(FOLLOW_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+
+def export_history(args):
     """Export history to formatted text file"""
-    if not os.path.exists(HISTORY_FILE):
+    if not os.path.exists(args.file):
         print("❌ No history file found")
         return
-    
+
     try:
-        with open(HISTORY_FILE, 'r') as f:
-            events = json.load(f)
-        
-        filename = f"history_export_{iraq_now().strftime('%Y%m%d_%H%M')}.txt"
-        
+        events = load_events(args)
+
+        filename = args.output or f"history_export_{iraq_now().strftime('%Y%m%d_%H%M')}.txt"
+
         with open(filename, 'w', encoding='utf-8') as f:
             f.write("STOCK HISTORY EXPORT\n")
             f.write("="*50 + "\n")
             f.write(f"Generated: {iraq_now().strftime('%d/%m/%Y %H:%M:%S')} Iraq Time\n")
             f.write(f"Total events: {len(events)}\n")
             f.write("="*50 + "\n\n")
-            
+
             for i, event in enumerate(events, 1):
-                event_time = datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
-                event_iraq = event_time.replace(tzinfo=timezone.utc) + timedelta(hours=3)
-                
                 f.write(f"Event #{i}\n")
-                f.write(f"  Time: {event_iraq.strftime('%d/%m/%Y %H:%M:%S')} Iraq\n")
+                f.write(f"  Time: {event_time(event).strftime('%d/%m/%Y %H:%M:%S')} Iraq\n")
                 f.write(f"  Product: {event.get('product', 'Unknown')}\n")
                 f.write(f"  Denomination: ₹{event.get('denomination', 'Unknown')}\n")
                 f.write(f"  Status: {event.get('status', 'Unknown')}\n")
                 f.write(f"  Price: {event.get('price', 'Unknown')}\n")
                 f.write("-"*30 + "\n")
-        
+
         print(f"✅ Exported to {filename}")
-        
+
     except Exception as e:
         print(f"❌ Error exporting: {e}")
 
+def build_parser():
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument('--file', default=HISTORY_FILE, help='history file (default: %(default)s)')
+    filters.add_argument('--since', type=parse_time_arg, help='start time: 12h, 2d or YYYY-MM-DD[ HH:MM] Iraq')
+    filters.add_argument('--until', type=parse_time_arg, help='end time, same formats as --since')
+    filters.add_argument('--denom', action='append', help='denomination, e.g. 1000 (repeatable)')
+    filters.add_argument('--status', choices=['IN_STOCK', 'OUT_STOCK'])
+
+    parser = argparse.ArgumentParser(description="📊 STOCK HISTORY TOOL")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('report', parents=[filters], help='summary report (default)')
+    q = sub.add_parser('query', parents=[filters], help='list matching events')
+    q.add_argument('--format', choices=['table', 'csv', 'json'], default='table')
+    q.add_argument('--limit', type=int, help='only the last N matching events')
+    q.add_argument('--follow', action='store_true', help='keep printing new events as they arrive')
+    e = sub.add_parser('export', parents=[filters], help='export events to a text file')
+    e.add_argument('--output', help='output file name')
+    return parser
+
 if __name__ == "__main__":
-    print("📊 STOCK HISTORY TOOL")
-    print("="*40)
-    print("1. View history report")
-    print("2. Export history to file")
-    print("="*40)
-    
-    choice = input("Enter your choice (1-2): ").strip()
-    
-    if choice == "1":
-        check_history()
-    elif choice == "2":
-        export_history()
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in ('report', 'query', 'export', '-h', '--help'):
+        argv = ['report'] + argv
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'query':
+        query(args)
+    elif args.command == 'export':
+        export_history(args)
     else:
-        print("❌ Invalid choice")
\ No newline at end of file
+        check_history(args)
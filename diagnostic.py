@@ -1,11 +1,26 @@
+import argparse
 import asyncio
 from telegram import Bot
 import os
 import json
+import statistics
+import tempfile
+import time
 from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin
+
+import aiohttp
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+from fake_useragent import UserAgent
+
+from main import (PRODUCTS, EventStatus, StockEvent, build_header_profile, parse_product_page,
+                  query_history, write_history_file)
 
 TELEGRAM_BOT_TOKEN = "8649783060:AAG2EvOnFL1C8nPLjqLfi1k-OQF_NyHTkwY"
 GROUP_CHAT_ID = "-1003891147099"
+REPORT_FILE = 'diagnostic_report.json'
 
 def iraq_now():
     utc_now = datetime.now(timezone.utc)
@@ -14,7 +29,7 @@ def iraq_now():
 async def diagnostic():
     print("🔍 RUNNING DIAGNOSTIC...")
     print("="*50)
-    
+
     # Test 1: Bot connection
     try:
         bot = Bot(token=TELEGRAM_BOT_TOKEN)
@@ -23,7 +38,7 @@ async def diagnostic():
     except Exception as e:
         print(f"❌ Bot connection failed: {e}")
         return
-    
+
     # Test 2: Send test message
     try:
         now = iraq_now()
@@ -34,27 +49,289 @@ async def diagnostic():
         print("✅ Test message sent to group")
     except Exception as e:
         print(f"❌ Cannot send to group: {e}")
-    
+
     # Test 3: Check history file
     if os.path.exists('stock_history.json'):
         with open('stock_history.json', 'r') as f:
             history = json.load(f)
         print(f"📊 History file has {len(history)} events")
-        
+
         # Show last event
         if history:
             last = history[-1]
             print(f"📝 Last event: {last.get('date')} {last.get('time')} - {last.get('status')}")
     else:
         print("📁 No history file yet")
-    
+
     # Test 4: Check when last report should have sent
     now = iraq_now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    noon = midnight.replace(hour=12)
+    if now < noon:
+        noon -= timedelta(days=1)
     print(f"\n⏱️ Current Iraq time: {now.strftime('%d/%m/%Y %H:%M:%S')}")
-    print(f"   Last 12AM: {(now.replace(hour=0, minute=0) if now.hour >= 0 else now.replace(hour=0, minute=0) - timedelta(days=1)).strftime('%d/%m %H:%M')}")
-    print(f"   Last 12PM: {(now.replace(hour=12, minute=0) if now.hour >= 12 else now.replace(hour=12, minute=0) - timedelta(days=1)).strftime('%d/%m %H:%M')}")
-    
+    print(f"   Last 12AM: {midnight.strftime('%d/%m %H:%M')}")
+    print(f"   Last 12PM: {noon.strftime('%d/%m %H:%M')}")
+
     print("="*50)
     print("✅ Diagnostic complete. Check Railway logs for more details.")
 
-asyncio.run(diagnostic())
\ No newline at end of file
+# ===== PERFORMANCE SELF-TEST =====
+def render_stub_page(denominations, in_stock=True, size=200_000, price="1,000"):
+    """Synthetic product page shaped like the parts of an Amazon page the checker reads"""
+    options = "".join(f'<option value="{d}">Rs. {d}</option>' for d in denominations)
+    if in_stock:
+        availability = '<div id="availability"><span class="a-color-success">In stock</span></div>'
+        button = '<input id="add-to-cart-button" type="submit"/>'
+    else:
+        availability = '<div id="availability"><span class="a-color-error">Currently unavailable.</span></div>'
+        button = ''
+    head = (
+        f'<html><head><title>PlayStation Gift Card</title></head><body>'
+        f'<div id="centerCol"><select name="denomination">{options}</select>'
+        f'<span class="a-price"><span class="a-price-whole">{price}.</span></span>'
+        f'{availability}{button}</div>'
+    )
+    filler = '<div class="a-section"><p>Customers also viewed these products and related items.</p></div>'
+    count = max(0, (size - len(head)) // len(filler))
+    return (head + filler * count + '</body></html>').encode('utf-8')
+
+def summarize(samples):
+    """min/avg/p95/max in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        'n': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 2),
+        'avg_ms': round(statistics.mean(ordered) * 1000, 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+async def start_stub_server():
+    """Local stand-ins for the Telegram Bot API and the product pages"""
+    pages = {}
+    for url, info in PRODUCTS.items():
+        code = url.rstrip('/').rsplit('/', 1)[-1]
+        pages[code] = render_stub_page(info['denominations'])
+
+    async def telegram_api(request):
+        method = request.match_info['method']
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def product(request):
+        body = pages.get(request.match_info['code'])
+        if body is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=body, content_type='text/html', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_route('*', '/bot{token}/{method}', telegram_api)
+    app.router.add_get('/d/{code}', product)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+async def measure_telegram(bot, samples):
+    timings = []
+    errors = 0
+    for _ in range(samples):
+        start = time.perf_counter()
+        try:
+            await bot.get_me()
+            timings.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+    return {'get_me': summarize(timings), 'errors': errors}
+
+async def measure_fetch(url, headers=None):
+    """One fresh connection per URL; DNS, connect and TTFB are measured per redirect hop"""
+    hops = []
+
+    def hop(hop_url):
+        hops.append({'url': str(hop_url), 'marks': {'start': time.perf_counter()}})
+
+    async def mark(name):
+        hops[-1]['marks'].setdefault(name, time.perf_counter())
+
+    async def on_start(session, ctx, params):
+        hop(params.url)
+
+    async def on_redirect(session, ctx, params):
+        await mark('headers')
+        hop(urljoin(str(params.url), params.response.headers.get('Location', '')))
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_redirect.append(on_redirect)
+    trace.on_dns_resolvehost_start.append(lambda *a: mark('dns_start'))
+    trace.on_dns_resolvehost_end.append(lambda *a: mark('dns_end'))
+    trace.on_connection_create_start.append(lambda *a: mark('connect_start'))
+    trace.on_connection_create_end.append(lambda *a: mark('connect_end'))
+    trace.on_request_end.append(lambda *a: mark('headers'))
+
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(trace_configs=[trace], timeout=timeout, headers=headers) as session:
+        async with session.get(url, allow_redirects=True) as response:
+            body = await response.read()
+            done = time.perf_counter()
+            status = response.status
+
+    def span(marks, a, b):
+        return round((marks[b] - marks[a]) * 1000, 2) if a in marks and b in marks else None
+
+    phases = [{
+        'url': h['url'],
+        'dns_ms': span(h['marks'], 'dns_start', 'dns_end'),
+        'connect_ms': span(h['marks'], 'connect_start', 'connect_end'),
+        'ttfb_ms': span(h['marks'], 'start', 'headers'),
+    } for h in hops]
+    final = phases[-1]
+    # Top-level phases describe the final hop (the product page); redirects are listed separately
+    return {
+        'status': status,
+        'bytes': len(body),
+        'dns_ms': final['dns_ms'],
+        'connect_ms': final['connect_ms'],
+        'ttfb_ms': final['ttfb_ms'],
+        'redirect_ms': round((hops[-1]['marks']['start'] - hops[0]['marks']['start']) * 1000, 2),
+        'total_ms': round((done - hops[0]['marks']['start']) * 1000, 2),
+        'hops': phases,
+    }, body
+
+def available_parsers():
+    parsers = ['html.parser']
+    for name, module in (('lxml', 'lxml'), ('html5lib', 'html5lib')):
+        try:
+            __import__(module)
+            parsers.append(name)
+        except ImportError:
+            pass
+    return parsers
+
+def measure_parse(body, denominations, repeats):
+    """Time BeautifulSoup with each installed parser, plus the checker's own parse"""
+    html = body.decode('utf-8', errors='replace')
+    result = {}
+    for parser in available_parsers():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            BeautifulSoup(html, parser).get_text()
+            timings.append(time.perf_counter() - start)
+        result[parser] = summarize(timings)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse_product_page(body, 'utf-8', tuple(denominations))
+        timings.append(time.perf_counter() - start)
+    result['checker'] = summarize(timings)
+    return result
+
+def measure_history(events=1000, rounds=5):
+    """Write/read throughput of the history file format on the bot's own disk"""
+    now = int(time.time())
+    sample = [StockEvent(now - (events - i) * 60, "PlayStation INDIA Gift Card", 1000,
+                         EventStatus(i % 2), 100000) for i in range(events)]
+    # Next to stock_history.json rather than /tmp, which may be a tmpfs
+    with tempfile.TemporaryDirectory(dir='.') as tmp:
+        path = os.path.join(tmp, 'stock_history.json')
+        writes, reads, windows = [], [], []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            write_history_file(path, sample)
+            writes.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            with open(path, 'r', encoding='utf-8') as f:
+                json.load(f)
+            reads.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            query_history(path, since=now - 12 * 3600)
+            windows.append(time.perf_counter() - start)
+        size = os.path.getsize(path)
+    return {
+        'events': events,
+        'file_bytes': size,
+        'write': summarize(writes),
+        'write_events_per_s': round(events / statistics.mean(writes)),
+        'full_read': summarize(reads),
+        'read_events_per_s': round(events / statistics.mean(reads)),
+        'indexed_12h_query': summarize(windows),
+    }
+
+async def performance_self_test(offline=False, samples=5, report_file=REPORT_FILE):
+    print("🏎️ RUNNING PERFORMANCE SELF-TEST" + (" (offline stubs)" if offline else ""))
+    print("="*50)
+    report = {'generated': iraq_now().isoformat(), 'offline': offline}
+    runner = None
+    try:
+        if offline:
+            runner, base = await start_stub_server()
+            bot = Bot(token="1:stub", base_url=f"{base}/bot")
+            urls = {f"{base}/d/{url.rstrip('/').rsplit('/', 1)[-1]}": info for url, info in PRODUCTS.items()}
+        else:
+            bot = Bot(token=TELEGRAM_BOT_TOKEN)
+            urls = PRODUCTS
+
+        report['telegram'] = await measure_telegram(bot, samples)
+        tg = report['telegram']['get_me']
+        print(f"📡 Telegram RTT: " + (f"avg {tg['avg_ms']}ms, p95 {tg['p95_ms']}ms" if tg else "failed"))
+
+        report['fetch'] = {}
+        report['parse'] = {}
+        # Same browser-like headers as the checker; a bare aiohttp UA usually gets a 503
+        headers = build_header_profile(UserAgent().random)
+        headers['Accept'] = 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
+        for url, info in urls.items():
+            try:
+                fetch, body = await measure_fetch(url, headers)
+            except Exception as e:
+                report['fetch'][url] = {'error': str(e)}
+                print(f"❌ {url}: {e}")
+                continue
+            report['fetch'][url] = fetch
+            phases = " ".join(f"{name} {fetch[name + '_ms']}ms" for name in ('dns', 'connect', 'ttfb', 'total')
+                              if fetch[name + '_ms'] is not None)
+            print(f"🌐 {url}: {fetch['status']} {fetch['bytes'] // 1024}KB {phases}")
+            if len(fetch['hops']) > 1:
+                print(f"   ↪️ {len(fetch['hops']) - 1} redirect(s), {fetch['redirect_ms']}ms before the final hop")
+            if fetch['status'] == 200:
+                report['parse'][url] = measure_parse(body, info['denominations'], samples)
+                timings = ", ".join(f"{name} {stats['avg_ms']}ms" for name, stats in report['parse'][url].items())
+                print(f"   🧩 parse: {timings}")
+
+        report['history'] = measure_history()
+        hist = report['history']
+        print(f"💾 History: write {hist['write_events_per_s']} events/s, "
+              f"read {hist['read_events_per_s']} events/s, "
+              f"12h indexed query {hist['indexed_12h_query']['avg_ms']}ms")
+    finally:
+        if runner:
+            await runner.cleanup()
+
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print("="*50)
+    print(f"✅ Self-test complete. JSON report: {report_file}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot diagnostic and performance self-test")
+    parser.add_argument('--perf', action='store_true', help='run the performance self-test')
+    parser.add_argument('--offline', action='store_true', help='use local Telegram and product page stubs')
+    parser.add_argument('--samples', type=int, default=5, help='repeats per measurement')
+    parser.add_argument('--report', default=REPORT_FILE, help='JSON report path')
+    args = parser.parse_args()
+
+    if args.perf or args.offline:
+        asyncio.run(performance_self_test(args.offline, args.samples, args.report))
+    else:
+        asyncio.run(diagnostic())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Synthetic load test - how many products can one instance watch within the detection budget?
+
+Starts a local product-page server in a separate process, points the real
+StockNotificationBot.monitor_products at N synthetic products with a fake
+Telegram sink, and ramps N, reporting the knee where each limit (cycle time,
+CPU, alert lag, RSS) is first hit.
+
+Examples:
+  python load_test.py
+  python load_test.py --products 10,100,1000 --duration 60 --latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+import main
+from diagnostic import render_stub_page
+
+REPORT_FILE = 'load_test_report.json'
+CPU_LIMIT = 0.9
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def synthetic_denomination(i):
+    # Unique per product so alerts are never deduplicated across products
+    return str(10000 + i)
+
+def flip_schedule(i, flip_period, started):
+    """Deterministic per-product flip phase shared by the server and the harness"""
+    phase = random.Random(i).uniform(0, flip_period)
+    return started - phase
+
+def in_stock_at(i, now, flip_period, started):
+    base = flip_schedule(i, flip_period, started)
+    return int((now - base) // flip_period) % 2 == 0
+
+def last_flip_at(i, now, flip_period, started):
+    base = flip_schedule(i, flip_period, started)
+    return base + (now - base) // flip_period * flip_period
+
+# ===== PRODUCT PAGE SERVER =====
+def serve_products(port_queue, latency, jitter, page_size, flip_period, started):
+    """Runs in a child process so page generation does not load the bot's event loop"""
+    template_in = render_stub_page(['DENOM'], in_stock=True, size=page_size)
+    template_out = render_stub_page(['DENOM'], in_stock=False, size=page_size)
+    hits = [0]
+
+    async def product(request):
+        i = int(request.match_info['i'])
+        hits[0] += 1
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+        template = template_in if in_stock_at(i, time.time(), flip_period, started) else template_out
+        body = template.replace(b'DENOM', synthetic_denomination(i).encode(), 2)
+        return web.Response(body=body, content_type='text/html', charset='utf-8')
+
+    async def stats(request):
+        return web.json_response({'hits': hits[0]})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/d/{i}', product)
+        app.router.add_get('/stats', stats)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+# ===== FAKE TELEGRAM =====
+class FakeTelegram:
+    """Records alert arrival times instead of talking to Telegram"""
+
+    def __init__(self, flip_period, started, latency=0.05):
+        self.flip_period = flip_period
+        self.started = started
+        self.latency = latency
+        self.messages = 0
+        self.lags = []
+        # Alerts for flips before this (initial state on the first sweep) have no meaningful lag
+        self.measure_from = time.time()
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.messages += 1
+        match = re.search(r'Synthetic Product (\d+)', text)
+        if match and ('STOCK AVAILABLE' in text or 'OUT OF STOCK' in text):
+            i = int(match.group(1))
+            flipped_at = last_flip_at(i, time.time(), self.flip_period, self.started)
+            if flipped_at >= self.measure_from:
+                self.lags.append(time.time() - flipped_at)
+
+    async def get_me(self):
+        return None
+
+# ===== RESOURCE SAMPLING =====
+def process_cpu_seconds(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+def process_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def bot_pids(bot):
+    pids = [os.getpid()]
+    pool = bot.checker.parse_pool
+    if pool is not None:
+        pids.extend(getattr(pool, '_processes', {}).keys())
+    return pids
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+# ===== RUN =====
+async def run_step(base, n, args, started):
+    """Run the real monitor loop against N products for args.duration seconds"""
+    main.PRODUCTS = {
+        f"{base}/d/{i}": {"name": f"Synthetic Product {i}", "denominations": [synthetic_denomination(i)]}
+        for i in range(n)
+    }
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    bot = main.StockNotificationBot("1:load-test", "load-test")
+    sink = FakeTelegram(args.flip_period, started)
+    bot.bot = sink
+    hits_before = await server_hits(base)
+    wall_start = time.time()
+    sink.measure_from = wall_start
+    cpu_start = sum(process_cpu_seconds(pid) for pid in bot_pids(bot))
+    monitor = asyncio.create_task(bot.monitor_products())
+    peak_rss = 0.0
+    try:
+        while time.time() - wall_start < args.duration:
+            await asyncio.sleep(1)
+            peak_rss = max(peak_rss, sum(process_rss_mb(pid) for pid in bot_pids(bot)))
+    finally:
+        monitor.cancel()
+        try:
+            await monitor
+        except asyncio.CancelledError:
+            pass
+        cpu_used = sum(process_cpu_seconds(pid) for pid in bot_pids(bot)) - cpu_start
+        await bot.cleanup()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    elapsed = time.time() - wall_start
+    checks = await server_hits(base) - hits_before
+    checks_per_sec = checks / elapsed
+    sweeps = list(bot.watchdog.sweeps)
+    # With no complete sweep, project the cycle time from the sustained rate
+    projected = n / checks_per_sec if checks_per_sec else float('inf')
+    return {
+        'products': n,
+        'checks': checks,
+        'checks_per_sec': round(checks_per_sec, 2),
+        'cycles': len(sweeps),
+        'cycle_p50_s': round(percentile(sweeps, 0.5), 2) if sweeps else None,
+        'cycle_p95_s': round(percentile(sweeps, 0.95), 2) if sweeps else None,
+        'cycle_projected_s': round(projected, 2),
+        'cpu_pct': round(100 * cpu_used / elapsed, 1),
+        'peak_rss_mb': round(peak_rss, 1),
+        'confirm_checks': bot.confirm_checks,
+        'confirm_s': round(bot.confirm_seconds, 1),
+        'alerts': len(sink.lags),
+        'alert_lag_p50_s': round(percentile(sink.lags, 0.5), 2) if sink.lags else None,
+        'alert_lag_p95_s': round(percentile(sink.lags, 0.95), 2) if sink.lags else None,
+    }
+
+async def server_hits(base):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base}/stats") as response:
+            return (await response.json())['hits']
+
+def active_limits(args):
+    return ['cycle', 'cpu', 'alert_lag'] + (['rss'] if args.max_rss else [])
+
+def limits_hit(step, args):
+    """Limit type -> description, for every limit this step breaks"""
+    cycle = step['cycle_p95_s'] if step['cycle_p95_s'] is not None else step['cycle_projected_s']
+    hit = {}
+    if cycle > args.budget:
+        hit['cycle'] = f"cycle time {cycle:.0f}s > {args.budget:.0f}s budget"
+    if step['cpu_pct'] > CPU_LIMIT * 100 * max(1, main.PARSE_WORKERS):
+        hit['cpu'] = f"CPU {step['cpu_pct']}%"
+    if step['alert_lag_p95_s'] is not None and step['alert_lag_p95_s'] > args.budget:
+        hit['alert_lag'] = f"alert lag p95 {step['alert_lag_p95_s']}s > budget"
+    if args.max_rss and step['peak_rss_mb'] > args.max_rss:
+        hit['rss'] = f"RSS {step['peak_rss_mb']}MB > {args.max_rss}MB"
+    return hit
+
+async def load_test(args):
+    if not args.verbose:
+        main.logger.setLevel(logging.WARNING)
+    main.REQUEST_DELAY = args.request_delay
+    main.PAGE_SPACING = args.page_spacing
+    main.CHECK_INTERVAL = 0
+    main.ALERT_COOLDOWN = 0
+    main.CONFIRM_DELAY = args.confirm_delay
+    main.SWEEP_SLO = args.budget
+
+    started = time.time()
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve_products,
+        args=(port_queue, args.latency, args.jitter, args.page_size, args.flip_period, started),
+        daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+    print("\n" + "="*60)
+    print("🏋️ SYNTHETIC LOAD TEST".center(60))
+    print("="*60)
+    print(f"Latency {args.latency}s ±{args.jitter}s | Page {args.page_size // 1024}KB | "
+          f"Flip every {args.flip_period:.0f}s | Confirm delay {args.confirm_delay:g}s | Budget {args.budget:.0f}s")
+    print(f"{'N':>6} {'chk/s':>7} {'cyc p95':>8} {'proj':>8} {'CPU%':>6} {'RSS MB':>7} {'confirm':>8} {'alerts':>6} {'lag p95':>8}")
+
+    steps = []
+    # Limit type -> the first N that broke it, and the last N that did not
+    knees = {}
+    try:
+        for n in args.products:
+            step = await run_step(base, n, args, started)
+            step['limits'] = limits_hit(step, args)
+            steps.append(step)
+            print(f"{n:>6} {step['checks_per_sec']:>7} {str(step['cycle_p95_s']):>8} "
+                  f"{step['cycle_projected_s']:>8} {step['cpu_pct']:>6} {step['peak_rss_mb']:>7} "
+                  f"{step['confirm_s']:>7}s "
+                  f"{step['alerts']:>6} {str(step['alert_lag_p95_s']):>8}")
+            for limit, detail in step['limits'].items():
+                if limit not in knees:
+                    last_ok = steps[-2]['products'] if len(steps) > 1 else 0
+                    knees[limit] = {'products': n, 'last_ok': last_ok, 'detail': detail}
+            # Keep ramping until every limit has its own knee
+            if not args.keep_going and all(limit in knees for limit in active_limits(args)):
+                break
+    finally:
+        server.terminate()
+
+    print("="*60)
+    for limit in active_limits(args):
+        knee = knees.get(limit)
+        if knee:
+            print(f"🚧 {limit}: knee between {knee['last_ok']} and {knee['products']} products ({knee['detail']})")
+        else:
+            print(f"✅ {limit}: not hit in the tested range")
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'report'},
+        'steps': steps,
+        'knees': knees,
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Report: {args.report}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic load test for the stock monitor")
+    parser.add_argument('--products', type=lambda v: [int(x) for x in v.split(',')],
+                        default=[10, 30, 100, 300, 1000, 3000, 10000], help='comma-separated N values')
+    parser.add_argument('--duration', type=float, default=60, help='seconds per step')
+    parser.add_argument('--latency', type=float, default=0.3, help='mean page latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='latency standard deviation')
+    parser.add_argument('--page-size', type=int, default=200_000, help='page size in bytes')
+    parser.add_argument('--flip-period', type=float, default=600, help='seconds between stock flips per product')
+    parser.add_argument('--request-delay', type=float, default=0, help='override REQUEST_DELAY')
+    parser.add_argument('--page-spacing', type=float, default=0, help='override PAGE_SPACING')
+    parser.add_argument('--confirm-delay', type=float, default=main.CONFIRM_DELAY,
+                        help='override CONFIRM_DELAY (pause before each confirmation re-check)')
+    parser.add_argument('--budget', type=float, default=main.CHECK_INTERVAL, help='detection budget in seconds')
+    parser.add_argument('--max-rss', type=float, default=0, help='RSS limit in MB (0 = none)')
+    parser.add_argument('--verbose', action='store_true', help='keep per-check INFO logging')
+    parser.add_argument('--keep-going', action='store_true', help='run every N even after all limits are hit')
+    parser.add_argument('--report', default=REPORT_FILE)
+    asyncio.run(load_test(parser.parse_args()))
@@ -3,17 +3,33 @@ import aiohttp
 from bs4 import BeautifulSoup
 import logging
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
 import time
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 import re
+import signal
 from fake_useragent import UserAgent
 import ssl
 import certifi
 import os
 from datetime import datetime, timedelta, timezone
+import base64
 import json
-from collections import defaultdict
+import multiprocessing
+import random
+import struct
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from array import array
+from bisect import bisect_left, bisect_right
+from enum import IntEnum
+from collections import defaultdict, deque
+from urllib.parse import urlsplit, urlunsplit
 
 # Configure logging
 logging.basicConfig(
@@ -27,9 +43,15 @@ TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID", "-100381147099")
 
 # Iraq timezone (UTC+3)
+IRAQ_OFFSET = timedelta(hours=3)
+
 def iraq_now():
     utc_now = datetime.now(timezone.utc)
-    return utc_now + timedelta(hours=3)
+    return utc_now + IRAQ_OFFSET
+
+def iraq_time(ts: int) -> datetime:
+    """Render an epoch timestamp as Iraq wall time"""
+    return datetime.fromtimestamp(ts, timezone.utc) + IRAQ_OFFSET
 
 # Products to monitor
 PRODUCTS = {
@@ -71,164 +93,1318 @@ OUT_OF_STOCK_INDICATORS = [
     "temporarily out of stock"
 ]
 
+# Amazon robot-check page markers
+CAPTCHA_INDICATORS = [
+    "enter the characters you see below",
+    "/errors/validatecaptcha",
+    "type the characters you see in this image",
+]
+
 CHECK_INTERVAL = 120
+# Pause before each request and between pages, to stay polite to Amazon
+REQUEST_DELAY = 2
+PAGE_SPACING = 3
 ALERT_COOLDOWN = 1800
+HISTORY_MAX_EVENTS = 1000
+HISTORY_RETENTION_DAYS = 7
+LATEST_EVENTS_PER_DENOM = 3
+HISTORY_FLUSH_DEBOUNCE = float(os.environ.get("HISTORY_FLUSH_DEBOUNCE", "5"))
+PRICE_HISTORY_FILE = 'price_history.json'
+PRICE_FLUSH_DEBOUNCE = 60
+PRICE_CHANGE_ALERTS = os.environ.get("PRICE_CHANGE_ALERTS", "0") == "1"
+PRICE_RAW_SAMPLES = 4096
+# (name, bucket seconds, buckets kept): 2 days of minutes, ~4 months of hours, 2 years of days
+PRICE_ROLLUPS = (('minute', 60, 2880), ('hour', 3600, 2880), ('day', 86400, 730))
+SWEEP_SLO = float(os.environ.get("SWEEP_SLO", str(CHECK_INTERVAL)))
+LOOP_LAG_SLO = float(os.environ.get("LOOP_LAG_SLO", "1.0"))
+STUCK_CHECK_TIMEOUT = 90
+WATCHDOG_INTERVAL = 1.0
+HEALTH_ALERT_COOLDOWN = 3600
+# How long a short link's resolved ASIN is trusted before fetching the link itself again
+CANONICAL_TTL = 86400
+# Consecutive agreeing samples needed before a status flip is reported; restocks
+# confirm faster than sell-outs. Re-checks run CONFIRM_DELAY seconds apart.
+RESTOCK_CONFIRMATIONS = int(os.environ.get("RESTOCK_CONFIRMATIONS", "2"))
+OUT_OF_STOCK_CONFIRMATIONS = int(os.environ.get("OUT_OF_STOCK_CONFIRMATIONS", "3"))
+CONFIRM_DELAY = 5
+# Enough immediate re-checks to confirm either direction; the first sample is the regular check
+MAX_CONFIRM_CHECKS = max(RESTOCK_CONFIRMATIONS, OUT_OF_STOCK_CONFIRMATIONS) - 1
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INLINE_PARSE_MAX_BYTES = int(os.environ.get("INLINE_PARSE_MAX_BYTES", str(64 * 1024)))
+SUBSCRIPTIONS_FILE = 'subscriptions.json'
+ALL_DENOMINATIONS = '*'
+# Telegram allows roughly 30 messages/second per bot across all chats
+TELEGRAM_GLOBAL_RATE = 25
+TELEGRAM_POOL_SIZE = 32
+COMMAND_POLL_TIMEOUT = 30
+HEADER_PROFILE_COUNT = int(os.environ.get("HEADER_PROFILE_COUNT", "12"))
+PROFILE_MIN_SCORE = 0.2
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 
+# ===== HEADER PROFILES =====
+ACCEPT_LANGUAGES = [
+    'en-IN,en;q=0.9',
+    'en-IN,en-GB;q=0.9,en;q=0.8',
+    'en-US,en;q=0.9',
+    'en-GB,en;q=0.9',
+    'en-IN,en;q=0.9,hi;q=0.8',
+]
+
+def build_header_profile(user_agent: str) -> Dict[str, str]:
+    """Build a consistent header set (UA, language, client hints) for one browser"""
+    headers = {
+        'User-Agent': user_agent,
+        'Accept-Language': random.choice(ACCEPT_LANGUAGES),
+    }
+    # Only Chromium-based browsers send client hints
+    chrome = re.search(r'Chrome/(\d+)', user_agent)
+    if chrome and 'Edg' not in user_agent and 'OPR' not in user_agent:
+        brand = 'Google Chrome'
+    elif chrome and 'Edg/' in user_agent:
+        brand = 'Microsoft Edge'
+    else:
+        brand = None
+    if brand:
+        major = chrome.group(1)
+        if 'Android' in user_agent:
+            platform = 'Android'
+        elif 'Windows' in user_agent:
+            platform = 'Windows'
+        elif 'Mac OS X' in user_agent:
+            platform = 'macOS'
+        else:
+            platform = 'Linux'
+        headers['sec-ch-ua'] = f'"Chromium";v="{major}", "{brand}";v="{major}", "Not-A.Brand";v="99"'
+        headers['sec-ch-ua-mobile'] = '?1' if 'Mobile' in user_agent else '?0'
+        headers['sec-ch-ua-platform'] = f'"{platform}"'
+    return headers
+
+class HeaderProfile:
+    __slots__ = ('headers', 'score', 'uses', 'captchas')
+
+    def __init__(self, headers: Dict[str, str]):
+        self.headers = headers
+        self.score = 1.0
+        self.uses = 0
+        self.captchas = 0
+
+class HeaderProfilePool:
+    """Pool of header profiles built once at startup and rotated per request"""
+
+    def __init__(self, ua: UserAgent, size: int = HEADER_PROFILE_COUNT):
+        self.ua = ua
+        self.size = size
+        self.profiles: List[HeaderProfile] = [self._new_profile() for _ in range(size)]
+
+    def _new_profile(self) -> HeaderProfile:
+        return HeaderProfile(build_header_profile(self.ua.random))
+
+    def pick(self) -> HeaderProfile:
+        """Draw a profile for one request, weighted by captcha health"""
+        profile = random.choices(self.profiles, weights=[p.score for p in self.profiles])[0]
+        profile.uses += 1
+        return profile
+
+    def report(self, profile: HeaderProfile, captcha: bool):
+        if captcha:
+            profile.captchas += 1
+            profile.score /= 2
+            if profile.score < PROFILE_MIN_SCORE and profile in self.profiles:
+                # Drop the burned fingerprint and replace it with a fresh one
+                self.profiles.remove(profile)
+                self.profiles.append(self._new_profile())
+                logger.warning(f"Dropped header profile after {profile.captchas} captchas")
+        else:
+            profile.score = min(1.0, profile.score + 0.05)
+
+# ===== BACKGROUND WRITER =====
+class BackgroundWriter:
+    """Runs a blocking flush function on a worker thread, coalescing bursts of requests"""
+
+    def __init__(self, flush_fn, debounce: float = HISTORY_FLUSH_DEBOUNCE, name: str = 'history-writer'):
+        self.flush_fn = flush_fn
+        self.debounce = debounce
+        self.cond = threading.Condition()
+        self.requested = 0
+        self.flushed = 0
+        self.urgent = False
+        self.closed = False
+        self.flushes = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def request(self):
+        """Mark data dirty; the write happens within the debounce window"""
+        with self.cond:
+            self.requested += 1
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.requested > self.flushed or self.closed)
+                if self.requested == self.flushed:
+                    return
+                # Let the rest of the burst arrive before writing once
+                self.cond.wait_for(lambda: self.urgent or self.closed, timeout=self.debounce)
+                target = self.requested
+                self.urgent = False
+            start = time.perf_counter()
+            try:
+                self.flush_fn()
+            except Exception as e:
+                logger.error(f"Background flush failed: {e}")
+            latency = time.perf_counter() - start
+            with self.cond:
+                self.flushed = target
+                self.flushes += 1
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+                self.total_latency += latency
+                self.cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Durability barrier: block until everything requested so far is written"""
+        with self.cond:
+            target = self.requested
+            self.urgent = True
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.flushed >= target, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        done = self.flush(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        return done
+
+    def metrics(self) -> Dict[str, float]:
+        with self.cond:
+            return {
+                'requests': self.requested,
+                'flushes': self.flushes,
+                'pending': self.requested - self.flushed,
+                'last_ms': round(self.last_latency * 1000, 2),
+                'max_ms': round(self.max_latency * 1000, 2),
+                'avg_ms': round(self.total_latency * 1000 / self.flushes, 2) if self.flushes else 0.0,
+            }
+
 # ===== HISTORY TRACKER =====
+# Stored in place of a missing price in event and price columns
+NO_PRICE = -1
+
+class EventStatus(IntEnum):
+    OUT_STOCK = 0
+    IN_STOCK = 1
+
+def parse_price_paise(price: str) -> Optional[int]:
+    """Normalize a scraped price like "1,000" or "₹1,000.50" to integer paise"""
+    match = re.search(r'\d[\d,]*(?:\.\d{1,2})?', price or "")
+    if not match:
+        return None
+    rupees, _, fraction = match.group().replace(',', '').partition('.')
+    return int(rupees) * 100 + int(fraction.ljust(2, '0') or 0)
+
+def format_price(paise: Optional[int]) -> str:
+    if paise is None:
+        return "Price not visible"
+    rupees, fraction = divmod(paise, 100)
+    return f"{rupees:,}.{fraction:02d}" if fraction else f"{rupees:,}"
+
+class StockEvent:
+    """A single status change; rendered to strings only when displayed or saved"""
+    __slots__ = ('ts', 'product', 'denomination', 'status', 'price')
+
+    def __init__(self, ts: int, product: str, denomination: int, status: EventStatus, price: Optional[int]):
+        self.ts = ts
+        self.product = sys.intern(product)
+        self.denomination = denomination
+        self.status = status
+        self.price = price
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StockEvent':
+        # Stored timestamps are Iraq wall time labelled as UTC
+        stamp = datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00'))
+        if stamp.tzinfo is None:
+            stamp = stamp.replace(tzinfo=timezone.utc)
+        ts = int((stamp - IRAQ_OFFSET).timestamp())
+        return cls(ts, data.get('product', ''), int(data['denomination']),
+                   EventStatus[data['status']], parse_price_paise(data.get('price', '')))
+
+    def to_dict(self) -> dict:
+        when = iraq_time(self.ts)
+        return {
+            'timestamp': when.isoformat(),
+            'date': when.strftime('%Y-%m-%d'),
+            'time': when.strftime('%H:%M:%S'),
+            'product': self.product,
+            'denomination': str(self.denomination),
+            'status': self.status.name,
+            'price': format_price(self.price)
+        }
+
+class EventRing:
+    """Fixed-capacity ring of events stored as parallel typed columns.
+
+    Overwrites the oldest event when full. Events are addressed by a running
+    sequence number; StockEvent objects are only built as views for rendering.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.stamps = array('q', bytes(8 * capacity))
+        self.denominations = array('I', bytes(array('I').itemsize * capacity))
+        self.statuses = array('b', bytes(capacity))
+        self.prices = array('q', bytes(8 * capacity))
+        self.product_ids = array('H', bytes(2 * capacity))
+        self.products: List[str] = []
+        self.product_index: Dict[str, int] = {}
+        # Sequence number of the next event; the oldest held is total - count
+        self.total = 0
+
+    @property
+    def count(self) -> int:
+        return min(self.total, self.capacity)
+
+    @property
+    def first_seq(self) -> int:
+        return self.total - self.count
+
+    def append(self, event: StockEvent):
+        product_id = self.product_index.get(event.product)
+        if product_id is None:
+            product_id = self.product_index[event.product] = len(self.products)
+            self.products.append(event.product)
+        slot = self.total % self.capacity
+        self.stamps[slot] = event.ts
+        self.denominations[slot] = event.denomination
+        self.statuses[slot] = event.status
+        self.prices[slot] = NO_PRICE if event.price is None else event.price
+        self.product_ids[slot] = product_id
+        self.total += 1
+
+    def event(self, seq: int) -> StockEvent:
+        slot = seq % self.capacity
+        price = self.prices[slot]
+        return StockEvent(self.stamps[slot], self.products[self.product_ids[slot]], self.denominations[slot],
+                          EventStatus(self.statuses[slot]), None if price == NO_PRICE else price)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for seq in range(self.first_seq, self.total):
+            yield self.event(seq)
+
+# ===== HISTORY INDEX =====
+# Sidecar "<history>.idx": header, then the event timestamps and byte offsets
+# as int64 arrays, so time-window queries can seek instead of parsing everything.
+INDEX_HEADER = struct.Struct('<4sqqq')
+INDEX_MAGIC = b'SHX1'
+
+def history_index_path(history_file: str) -> str:
+    return history_file + '.idx'
+
+def replace_atomically(path: str, data: bytes):
+    """Write to a unique temp file beside path, then swap it in"""
+    fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    try:
+        # mkstemp creates 0600; keep the permissions a plain open() would give
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+        raise
+
+def write_history_file(history_file: str, events: List[StockEvent]):
+    """Write events one JSON object per line and refresh the sidecar index"""
+    stamps = array('q')
+    offsets = array('q')
+    chunks = [b'[\n']
+    position = 2
+    for i, event in enumerate(events):
+        line = json.dumps(event.to_dict()).encode('utf-8') + (b',\n' if i < len(events) - 1 else b'\n')
+        stamps.append(event.ts)
+        offsets.append(position)
+        chunks.append(line)
+        position += len(line)
+    chunks.append(b']\n')
+    replace_atomically(history_file, b''.join(chunks))
+    write_history_index(history_file, stamps, offsets)
+
+def write_history_index(history_file: str, stamps: array, offsets: array):
+    st = os.stat(history_file)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, st.st_size, st.st_mtime_ns, len(stamps))
+    replace_atomically(history_index_path(history_file), header + stamps.tobytes() + offsets.tobytes())
+
+def read_history_index(history_file: str, st: Optional[os.stat_result] = None) -> Optional[Tuple[array, array]]:
+    """Load the sidecar index, or None if it is missing or stale against st (default: stat now)"""
+    try:
+        if st is None:
+            st = os.stat(history_file)
+        with open(history_index_path(history_file), 'rb') as f:
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or size != st.st_size or mtime_ns != st.st_mtime_ns:
+                return None
+            stamps = array('q')
+            offsets = array('q')
+            stamps.fromfile(f, count)
+            offsets.fromfile(f, count)
+        return stamps, offsets
+    except (OSError, EOFError, struct.error):
+        return None
+
+def build_history_index(history_file: str, raw: Optional[bytes] = None, persist: bool = True) -> Tuple[array, array]:
+    """Scan a history file of any layout once; persist=False for read-only callers"""
+    if raw is None:
+        with open(history_file, 'rb') as f:
+            raw = f.read()
+    text = raw.decode('utf-8')
+    decoder = json.JSONDecoder()
+    stamps = array('q')
+    offsets = array('q')
+    pos = text.find('[') + 1
+    byte_pos, char_pos = pos, pos
+    while True:
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(text) or text[pos] == ']':
+            break
+        byte_pos += len(text[char_pos:pos].encode('utf-8'))
+        char_pos = pos
+        item, pos = decoder.raw_decode(text, pos)
+        try:
+            ts = StockEvent.from_dict(item).ts
+        except (KeyError, ValueError):
+            continue
+        stamps.append(ts)
+        offsets.append(byte_pos)
+    # Entries must be sorted for bisecting; hand-edited files may not be
+    if any(stamps[i] > stamps[i + 1] for i in range(len(stamps) - 1)):
+        pairs = sorted(zip(stamps, offsets))
+        stamps = array('q', (p[0] for p in pairs))
+        offsets = array('q', (p[1] for p in pairs))
+    if persist:
+        write_history_index(history_file, stamps, offsets)
+    return stamps, offsets
+
+def query_history(history_file: str, since: Optional[int] = None, until: Optional[int] = None) -> List[dict]:
+    """Return stored events with since <= ts <= until, seeking via the index.
+
+    Read-only: a stale index is rebuilt in memory, never written, so this is
+    safe to run while the bot is saving. The index is checked against the
+    same open file the events are read from; a decode error (file rewritten
+    in place) is retried once.
+    """
+    for attempt in range(2):
+        try:
+            f = open(history_file, 'rb')
+        except FileNotFoundError:
+            return []
+        with f:
+            st = os.fstat(f.fileno())
+            index = read_history_index(history_file, st)
+            try:
+                if index is None:
+                    index = build_history_index(history_file, f.read(), persist=False)
+                stamps, offsets = index
+                lo = bisect_left(stamps, since) if since is not None else 0
+                hi = bisect_right(stamps, until) if until is not None else len(stamps)
+                decoder = json.JSONDecoder()
+                events = []
+                for i in range(lo, hi):
+                    f.seek(offsets[i])
+                    end = offsets[i + 1] if i + 1 < len(offsets) and offsets[i + 1] > offsets[i] else None
+                    chunk = f.read(end - offsets[i]) if end else f.read()
+                    item, _ = decoder.raw_decode(chunk.decode('utf-8'))
+                    events.append(item)
+                return events
+            except ValueError:
+                if attempt:
+                    raise
+    return []
+
 class StockHistory:
-    def __init__(self, history_file='stock_history.json'):
+    """Event log plus running per-day and per-hour aggregates for reports"""
+
+    def __init__(self, history_file='stock_history.json', max_events=HISTORY_MAX_EVENTS):
         self.history_file = history_file
-        self.events = []
-        self.daily_stats = defaultdict(lambda: {'in_stock': 0, 'out_stock': 0, 'events': []})
+        self.events = EventRing(max_events)
+        # first_seq/last_seq: the day's span of ring sequence numbers, for listing its events
+        self.daily_stats = defaultdict(lambda: {'in_stock': 0, 'out_stock': 0, 'first_seq': None, 'last_seq': None,
+                                                'by_denom': defaultdict(lambda: [0, 0])})
+        # hour index (epoch // 3600) -> denomination -> [out, in] counts
+        self.hourly_stats = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        # Same per minute (sparse), for the partial first hour of a report window
+        self.minute_stats = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        self.latest = defaultdict(lambda: deque(maxlen=LATEST_EVENTS_PER_DENOM))
+        self.summary_cache: Dict[tuple, str] = {}
+        # hours -> (window start, summary); one entry per window length
+        self.window_cache: Dict[int, Tuple[int, str]] = {}
+        self.current_day = None
+        # Guards the ring between the event loop and the writer thread
+        self.lock = threading.Lock()
         self.load_history()
+        self.writer = BackgroundWriter(self.save_history)
     
     def load_history(self):
         try:
             if os.path.exists(self.history_file):
                 with open(self.history_file, 'r', encoding='utf-8') as f:
-                    self.events = json.load(f)
+                    data = json.load(f)
+                for item in data:
+                    try:
+                        self._add(StockEvent.from_dict(item))
+                    except (KeyError, ValueError):
+                        continue
         except:
-            self.events = []
+            self.events = EventRing(self.events.capacity)
     
     def save_history(self):
         try:
-            events_to_save = self.events[-1000:]
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(events_to_save, f, indent=2)
-        except:
-            pass
+            with self.lock:
+                events = list(self.events)
+            write_history_file(self.history_file, events)
+        except Exception as e:
+            logger.error(f"Failed to save history: {e}")
+
+    def _add(self, event: StockEvent):
+        with self.lock:
+            seq = self.events.total
+            self.events.append(event)
+        date_key = iraq_time(event.ts).strftime('%Y-%m-%d')
+        day = self.daily_stats[date_key]
+        if day['first_seq'] is None:
+            day['first_seq'] = seq
+        day['last_seq'] = seq
+        if event.status == EventStatus.IN_STOCK:
+            day['in_stock'] += 1
+        else:
+            day['out_stock'] += 1
+        day['by_denom'][event.denomination][event.status] += 1
+        self.hourly_stats[event.ts // 3600][event.denomination][event.status] += 1
+        self.minute_stats[event.ts // 60][event.denomination][event.status] += 1
+        self.latest[event.denomination].append(event)
+        self.summary_cache.clear()
+        self.window_cache.clear()
+        if date_key != self.current_day:
+            self.current_day = date_key
+            self._prune(event.ts)
+
+    def _prune(self, now_ts: int):
+        """Drop aggregates older than the retention window (runs once per day)"""
+        cutoff_ts = now_ts - HISTORY_RETENTION_DAYS * 86400
+        cutoff_day = iraq_time(cutoff_ts).strftime('%Y-%m-%d')
+        for date_key in [d for d in self.daily_stats if d < cutoff_day]:
+            del self.daily_stats[date_key]
+        for hour in [h for h in self.hourly_stats if h < cutoff_ts // 3600]:
+            del self.hourly_stats[hour]
+        for minute in [m for m in self.minute_stats if m < cutoff_ts // 60]:
+            del self.minute_stats[minute]
     
     def record_event(self, product_name, denomination, status, price):
-        now = iraq_now()
-        event = {
-            'timestamp': now.isoformat(),
-            'date': now.strftime('%Y-%m-%d'),
-            'time': now.strftime('%H:%M:%S'),
-            'product': product_name,
-            'denomination': denomination,
-            'status': status,
-            'price': price
-        }
-        self.events.append(event)
-        date_key = now.strftime('%Y-%m-%d')
-        if status == 'IN_STOCK':
-            self.daily_stats[date_key]['in_stock'] += 1
-        else:
-            self.daily_stats[date_key]['out_stock'] += 1
-        self.daily_stats[date_key]['events'].append(event)
-        self.save_history()
+        event = StockEvent(int(time.time()), product_name, int(denomination),
+                           EventStatus[status], parse_price_paise(price))
+        self._add(event)
+        self.writer.request()
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush pending events to disk and stop the writer thread"""
+        if not self.writer.close(timeout):
+            logger.error("History flush did not finish before shutdown")
+        logger.info(f"History writer stats: {self.writer.metrics()}")
     
     def get_daily_summary(self, date=None):
         if date is None:
             date = iraq_now().strftime('%Y-%m-%d')
         if date not in self.daily_stats:
             return f"No events recorded for {date}"
+        cache_key = ('day', date)
+        if cache_key in self.summary_cache:
+            return self.summary_cache[cache_key]
         stats = self.daily_stats[date]
-        events = stats['events']
+        by_denom = stats['by_denom']
+        # The day's events are the still-held part of its sequence span in the ring
+        day_start = int((datetime.strptime(date, '%Y-%m-%d').replace(tzinfo=timezone.utc) - IRAQ_OFFSET).timestamp())
+        with self.lock:
+            first = max(stats['first_seq'], self.events.first_seq)
+            day_events = [self.events.event(seq) for seq in range(first, stats['last_seq'] + 1)]
+        day_events = [e for e in day_events if day_start <= e.ts < day_start + 86400]
         lines = []
         lines.append(f"📊 DAILY SUMMARY - {date}")
         lines.append("━━━━━━━━━━━━━━━━━━━━")
         lines.append(f"🟢 IN STOCK: {stats['in_stock']}")
         lines.append(f"🔴 OUT STOCK: {stats['out_stock']}")
-        lines.append(f"📊 Total: {len(events)}")
-        if events:
+        lines.append(f"📊 Total: {stats['in_stock'] + stats['out_stock']}")
+        if by_denom:
             lines.append("")
             lines.append("📋 Events:")
-            by_denom = defaultdict(list)
-            for e in events:
-                by_denom[e['denomination']].append(e)
-            for denom in sorted(by_denom.keys(), key=lambda x: int(x)):
-                denom_events = by_denom[denom]
+            for denom in sorted(by_denom.keys()):
+                counts = by_denom[denom]
+                lines.append(f"  ₹{denom}: 🟢 {counts[1]} | 🔴 {counts[0]}")
+                for e in day_events:
+                    if e.denomination != denom:
+                        continue
+                    emoji = "🟢" if e.status == EventStatus.IN_STOCK else "🔴"
+                    lines.append(f"    {emoji} {iraq_time(e.ts).strftime('%H:%M:%S')} - {e.status.name}")
+        summary = "\n".join(lines)
+        self.summary_cache[cache_key] = summary
+        return summary
+
+    def get_window_summary(self, hours=12):
+        """Summary of exactly the last N hours (to the minute) from hourly and minute counters"""
+        now_ts = int(time.time())
+        since = (now_ts - hours * 3600) // 60 * 60
+        first_hour = since // 3600
+        cached = self.window_cache.get(hours)
+        if cached and cached[0] == since:
+            return cached[1]
+        by_denom = defaultdict(lambda: [0, 0])
+        for hour in range(first_hour + 1, now_ts // 3600 + 1):
+            for denom, counts in self.hourly_stats.get(hour, {}).items():
+                by_denom[denom][0] += counts[0]
+                by_denom[denom][1] += counts[1]
+        # The first hour is only partly inside the window
+        for minute in range(since // 60, (first_hour + 1) * 60):
+            for denom, counts in self.minute_stats.get(minute, {}).items():
+                by_denom[denom][0] += counts[0]
+                by_denom[denom][1] += counts[1]
+        lines = []
+        if not by_denom:
+            lines.append(f"📭 No activity in the last {hours} hours")
+            lines.append("")
+            lines.append("✓ Bot is running")
+            lines.append(f"✓ Checking every {CHECK_INTERVAL // 60} minutes")
+            lines.append("✓ Waiting for stock")
+        else:
+            out_count = sum(c[0] for c in by_denom.values())
+            in_count = sum(c[1] for c in by_denom.values())
+            lines.append("📊 SUMMARY")
+            lines.append(f"  🟢 IN STOCK: {in_count}")
+            lines.append(f"  🔴 OUT STOCK: {out_count}")
+            lines.append(f"  📊 Total events: {in_count + out_count}\n")
+            lines.append("📋 DETAILS BY DENOMINATION")
+            for denom in sorted(by_denom.keys()):
+                counts = by_denom[denom]
+                lines.append("")
                 lines.append(f"  ₹{denom}:")
-                for e in denom_events:
-                    emoji = "🟢" if e['status'] == 'IN_STOCK' else "🔴"
-                    lines.append(f"    {emoji} {e['time']} - {e['status']}")
-        return "\n".join(lines)
+                lines.append(f"    🟢 IN: {counts[1]} | 🔴 OUT: {counts[0]}")
+                for e in self.latest[denom]:
+                    if e.ts >= since:
+                        emoji = "🟢" if e.status == EventStatus.IN_STOCK else "🔴"
+                        lines.append(f"    {emoji} {iraq_time(e.ts).strftime('%H:%M')} - {e.status.name}")
+        summary = "\n".join(lines)
+        self.window_cache[hours] = (since, summary)
+        return summary
+
+# ===== PRICE SERIES =====
+# Rollup buckets are aligned to Iraq time so days start at local midnight
+BUCKET_OFFSET = int(IRAQ_OFFSET.total_seconds())
+
+def _pack(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+def _unpack(typecode: str, data: str) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    return values
+
+class PriceRing:
+    """Raw price samples: delta-encoded timestamps and paise prices in bounded arrays"""
+
+    def __init__(self, capacity: int = PRICE_RAW_SAMPLES):
+        self.capacity = capacity
+        # Arrays grow up to capacity, then wrap, so idle series stay tiny
+        self.deltas = array('I')
+        self.prices = array('q')
+        self.start = 0
+        self.count = 0
+        self.first_ts = 0
+        self.last_ts = 0
+
+    def append(self, ts: int, price: int):
+        if self.count == self.capacity:
+            # Evict the oldest sample; the next one becomes the absolute base
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+            self.first_ts += self.deltas[self.start]
+        if self.count == 0:
+            self.first_ts = ts
+            delta = 0
+        else:
+            delta = max(0, ts - self.last_ts)
+        slot = (self.start + self.count) % self.capacity
+        if slot == len(self.deltas):
+            self.deltas.append(delta)
+            self.prices.append(price)
+        else:
+            self.deltas[slot] = delta
+            self.prices[slot] = price
+        self.count += 1
+        self.last_ts = self.last_ts + delta if self.count > 1 else ts
+
+    def __iter__(self):
+        ts = self.first_ts
+        for i in range(self.count):
+            slot = (self.start + i) % self.capacity
+            if i:
+                ts += self.deltas[slot]
+            yield ts, self.prices[slot]
+
+    def to_dict(self) -> dict:
+        order = [(self.start + i) % self.capacity for i in range(self.count)]
+        return {
+            'first_ts': self.first_ts,
+            'deltas': _pack(array('I', (self.deltas[i] for i in order))),
+            'prices': _pack(array('q', (self.prices[i] for i in order))),
+        }
+
+    def load(self, data: dict):
+        deltas = _unpack('I', data['deltas'])[-self.capacity:]
+        prices = _unpack('q', data['prices'])[-self.capacity:]
+        ts = data['first_ts']
+        for i, (delta, price) in enumerate(zip(deltas, prices)):
+            ts = ts + delta if i else ts
+            self.append(ts, price)
+
+class PriceRollup:
+    """Bounded ring of min/max/sum/last per time bucket"""
+    FIELDS = (('starts', 'q'), ('mins', 'q'), ('maxs', 'q'), ('sums', 'q'), ('lasts', 'q'), ('counts', 'I'))
+
+    def __init__(self, period: int, capacity: int):
+        self.period = period
+        self.capacity = capacity
+        for field, typecode in self.FIELDS:
+            setattr(self, field, array(typecode))
+        self.start = 0
+        self.count = 0
+
+    def add(self, ts: int, price: int):
+        bucket = (ts + BUCKET_OFFSET) // self.period * self.period - BUCKET_OFFSET
+        last = (self.start + self.count - 1) % self.capacity
+        if self.count and self.starts[last] == bucket:
+            self.mins[last] = min(self.mins[last], price)
+            self.maxs[last] = max(self.maxs[last], price)
+            self.sums[last] += price
+            self.lasts[last] = price
+            self.counts[last] += 1
+            return
+        if self.count and bucket < self.starts[last]:
+            return
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+        slot = (self.start + self.count) % self.capacity
+        if slot == len(self.starts):
+            for field, _ in self.FIELDS:
+                getattr(self, field).append(0)
+        self.starts[slot] = bucket
+        self.mins[slot] = self.maxs[slot] = self.sums[slot] = self.lasts[slot] = price
+        self.counts[slot] = 1
+        self.count += 1
+
+    def buckets(self, since: int = 0) -> List[Tuple[int, int, int, int, int]]:
+        """(bucket start, min, max, avg, last) for buckets starting at or after since"""
+        rows = []
+        for i in range(self.count):
+            slot = (self.start + i) % self.capacity
+            if self.starts[slot] >= since - self.period:
+                rows.append((self.starts[slot], self.mins[slot], self.maxs[slot],
+                             self.sums[slot] // self.counts[slot], self.lasts[slot]))
+        return rows
+
+    def to_dict(self) -> dict:
+        order = [(self.start + i) % self.capacity for i in range(self.count)]
+        return {field: _pack(array(typecode, (getattr(self, field)[i] for i in order)))
+                for field, typecode in self.FIELDS}
+
+    def load(self, data: dict):
+        for field, typecode in self.FIELDS:
+            setattr(self, field, _unpack(typecode, data[field])[-self.capacity:])
+        self.count = len(self.starts)
+        self.start = 0
+
+class PriceSeries:
+    """Every observed price for one denomination, with minute/hour/day rollups"""
+
+    def __init__(self):
+        self.raw = PriceRing()
+        self.rollups = {name: PriceRollup(period, capacity) for name, period, capacity in PRICE_ROLLUPS}
+        self.last_price: Optional[int] = None
+
+    def add(self, ts: int, price: Optional[int]):
+        self.raw.append(ts, NO_PRICE if price is None else price)
+        if price is not None:
+            for rollup in self.rollups.values():
+                rollup.add(ts, price)
+            self.last_price = price
+
+class PriceStore:
+    """Price time-series per (denomination, listing) persisted in the background.
+
+    A denomination can be sold on several listings at different prices, so each
+    listing (its canonical page URL) gets its own series and change detection.
+    """
+
+    def __init__(self, price_file=PRICE_HISTORY_FILE):
+        self.price_file = price_file
+        self.series: Dict[Tuple[int, str], PriceSeries] = defaultdict(PriceSeries)
+        self.lock = threading.Lock()
+        self.load()
+        self.writer = BackgroundWriter(self.save, PRICE_FLUSH_DEBOUNCE, name='price-writer')
+
+    def load(self):
+        try:
+            if os.path.exists(self.price_file):
+                with open(self.price_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for key, item in data.get('series', {}).items():
+                    # "<denomination> <listing>"; files from before listings were tracked have no listing
+                    denom, _, source = key.partition(' ')
+                    series = self.series[(int(denom), source)]
+                    series.raw.load(item['raw'])
+                    for name, rollup in series.rollups.items():
+                        if name in item:
+                            rollup.load(item[name])
+                    series.last_price = item.get('last_price')
+        except Exception as e:
+            logger.error(f"Failed to load price history: {e}")
+            self.series.clear()
+
+    def save(self):
+        try:
+            with self.lock:
+                data = {'series': {
+                    f"{denom} {source}".rstrip(): dict({'raw': series.raw.to_dict(), 'last_price': series.last_price},
+                                                       **{name: rollup.to_dict() for name, rollup in series.rollups.items()})
+                    for (denom, source), series in self.series.items()
+                }}
+            replace_atomically(self.price_file, json.dumps(data).encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Failed to save price history: {e}")
+
+    def record(self, denomination, price: Optional[int], source: str = "", ts: Optional[int] = None) -> Optional[int]:
+        """Store one sample from a listing; returns its previous price if a visible price changed"""
+        with self.lock:
+            series = self.series[(int(denomination), source)]
+            previous = series.last_price
+            series.add(int(time.time()) if ts is None else ts, price)
+        self.writer.request()
+        if price is not None and previous is not None and price != previous:
+            return previous
+        return None
+
+    def denominations(self) -> List[int]:
+        with self.lock:
+            return sorted({denom for denom, _ in self.series})
+
+    def latest_price(self, denomination) -> Optional[int]:
+        """Last visible price of the most recently sampled listing of a denomination"""
+        with self.lock:
+            candidates = [series for (denom, _), series in self.series.items()
+                          if denom == int(denomination) and series.last_price is not None]
+            if not candidates:
+                return None
+            return max(candidates, key=lambda series: series.raw.last_ts).last_price
+
+    def trend(self, denomination, resolution: str = 'hour', window: int = 86400) -> List[Tuple[int, int, int, int, int]]:
+        """Rollup rows (start, min, max, avg, last) of every listing, covering the last `window` seconds"""
+        since = int(time.time()) - window
+        with self.lock:
+            rows = []
+            for (denom, _), series in self.series.items():
+                if denom == int(denomination):
+                    rows.extend(series.rollups[resolution].buckets(since))
+            return sorted(rows)
+
+    def close(self, timeout: Optional[float] = None):
+        self.writer.close(timeout)
 
 # ===== STOCK CHECKER =====
+ASIN_PATTERN = re.compile(r'/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})')
+
+def canonical_product_url(url: str) -> Optional[str]:
+    """Reduce a resolved product URL to scheme://host/dp/ASIN, or None if it is not a product page"""
+    parts = urlsplit(url)
+    match = ASIN_PATTERN.search(parts.path)
+    if match:
+        return urlunsplit((parts.scheme, parts.netloc, f'/dp/{match.group(1)}', '', ''))
+    return None
+
+class StockState(IntEnum):
+    OUT = 0
+    IN = 1
+    UNKNOWN = 2
+
+class StockTracker:
+    """Per-denomination hysteresis: a flip is confirmed only after enough agreeing samples"""
+    __slots__ = ('confirmed', 'candidate', 'streak', 'unknowns')
+
+    def __init__(self, confirmed: bool = False):
+        self.confirmed = confirmed
+        self.candidate: Optional[bool] = None
+        self.streak = 0
+        self.unknowns = 0
+
+    @property
+    def pending(self) -> bool:
+        return self.candidate is not None
+
+    def observe(self, state: StockState) -> Optional[bool]:
+        """Feed one sample; returns the new status when a flip is confirmed"""
+        if state == StockState.UNKNOWN:
+            # Errors neither confirm nor cancel a suspected flip
+            self.unknowns += 1
+            return None
+        in_stock = state == StockState.IN
+        if in_stock == self.confirmed:
+            self.candidate = None
+            self.streak = 0
+            return None
+        if self.candidate == in_stock:
+            self.streak += 1
+        else:
+            self.candidate = in_stock
+            self.streak = 1
+        needed = RESTOCK_CONFIRMATIONS if in_stock else OUT_OF_STOCK_CONFIRMATIONS
+        if self.streak < needed:
+            return None
+        self.confirmed = in_stock
+        self.candidate = None
+        self.streak = 0
+        return in_stock
+
+SELECTED_VARIANT_SELECTORS = ('#variation_size_name .selection, #variation_style_name .selection, '
+                              'li.swatchSelect, select[name="denomination"] option[selected]')
+
+def parse_product_page(raw: bytes, encoding: str, denominations: Tuple[str, ...]) -> Tuple[bool, Tuple[int, ...], str, str, str]:
+    """Parse a product page into (captcha, StockState per denomination, status_msg, price, selected variant).
+
+    Module-level so it can run in a worker process; takes raw bytes and
+    returns only a small tuple to keep pickling cheap.
+    """
+    html = raw.decode(encoding, errors='replace')
+    html_lower = html.lower()
+    if any(indicator in html_lower for indicator in CAPTCHA_INDICATORS):
+        return True, tuple(StockState.UNKNOWN for _ in denominations), "Captcha", "", ""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    page_text = soup.get_text()
+    page_text_lower = page_text.lower()
+    is_out_of_stock = any(indicator in page_text_lower for indicator in OUT_OF_STOCK_INDICATORS)
+    buy_box = soup.select_one('#buy-now-button, #add-to-cart-button, .a-button-input')
+    has_buy_button = buy_box is not None and buy_box.get('aria-disabled') != 'true'
+    if has_buy_button and not is_out_of_stock:
+        page_state = StockState.IN
+    elif is_out_of_stock or buy_box is not None:
+        page_state = StockState.OUT
+    else:
+        # Neither a buy box nor an out-of-stock notice: not a page we can judge
+        page_state = StockState.UNKNOWN
+    
+    states = []
+    for denomination in denominations:
+        # Check denomination
+        denomination_selectors = [
+            f'select option[value*="{denomination}"]',
+            f'option:contains("Rs. {denomination}")',
+            f'option:contains("₹{denomination}")',
+        ]
+        denomination_exists = False
+        for selector in denomination_selectors:
+            if soup.select_one(selector):
+                denomination_exists = True
+                break
+        denomination_in_text = f"Rs.{denomination}" in page_text or f"₹{denomination}" in page_text
+        
+        states.append(page_state if denomination_exists or denomination_in_text else StockState.UNKNOWN)
+    
+    price_element = (soup.select_one('.a-price-whole') or 
+                   soup.select_one('#priceblock_ourprice') or 
+                   soup.select_one('.a-price .a-offscreen'))
+    price = price_element.get_text().strip() if price_element else "Price not visible"
+    # On multi-variant listings the page price belongs to the selected variant only
+    selected = ""
+    selection = soup.select_one(SELECTED_VARIANT_SELECTORS)
+    if selection is not None:
+        selected_paise = parse_price_paise(selection.get('title') or selection.get_text())
+        if selected_paise is not None and selected_paise % 100 == 0:
+            selected = str(selected_paise // 100)
+    
+    availability = soup.select_one('#availability span, .a-color-success, .a-color-error')
+    status_msg = availability.get_text().strip() if availability else "Unknown status"
+    return False, tuple(states), status_msg, price, selected
+
 class AmazonStockChecker:
     def __init__(self):
         self.ua = UserAgent()
+        self.profiles = HeaderProfilePool(self.ua)
         self.session = None
         self.connector = None
+        self.session_user_agent: Optional[str] = None
+        self.parse_pool: Optional[ProcessPoolExecutor] = None
+        # catalog URL -> (canonical product URL, resolved at)
+        self.canonical: Dict[str, Tuple[str, float]] = {}
+        self.trackers: Dict[Tuple[str, str], StockTracker] = {}
         self.last_status: Dict[str, Dict[str, Tuple[bool, str]]] = {}
 
     async def get_session(self):
         if self.session is None or self.session.closed:
             self.connector = aiohttp.TCPConnector(ssl=ssl_context)
+            # Per-browser headers are sent per request from the profile pool
             headers = {
-                'User-Agent': self.ua.random,
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
             }
             self.session = aiohttp.ClientSession(headers=headers, connector=self.connector)
         return self.session
 
-    async def check_denomination_stock(self, url: str, denomination: str, product_info: dict) -> Tuple[bool, str, str]:
+    async def parse_page(self, raw: bytes, encoding: str, denominations: Tuple[str, ...]) -> Tuple[bool, Tuple[int, ...], str, str, str]:
+        """Parse in the worker pool so the event loop stays free; small pages parse inline"""
+        if PARSE_WORKERS <= 0 or len(raw) <= INLINE_PARSE_MAX_BYTES:
+            return parse_product_page(raw, encoding, denominations)
+        if self.parse_pool is None:
+            # The bot already runs writer threads; forking it could copy a held lock into a worker
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS,
+                                                  mp_context=multiprocessing.get_context(method))
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.parse_pool, parse_product_page, raw, encoding, denominations)
+        except BrokenProcessPool:
+            logger.error("Parse worker pool broke, parsing inline until it is recreated")
+            broken, self.parse_pool = self.parse_pool, None
+            broken.shutdown(wait=False, cancel_futures=True)
+            return parse_product_page(raw, encoding, denominations)
+
+    def build_fetch_plan(self, products: dict) -> Dict[str, List[Tuple[str, dict, str]]]:
+        """Group catalog entries by the page they resolve to, so each page is fetched once.
+
+        Returns fetch URL -> [(catalog URL, product info, denomination), ...].
+        Catalog URLs not resolved yet (or past CANONICAL_TTL) are fetched as-is,
+        which resolves them for the next cycle.
+        """
+        now = time.time()
+        plan: Dict[str, List[Tuple[str, dict, str]]] = {}
+        for url, product_info in products.items():
+            resolved = self.canonical.get(url)
+            fetch_url = resolved[0] if resolved and now - resolved[1] < CANONICAL_TTL else url
+            targets = plan.setdefault(fetch_url, [])
+            for denomination in product_info["denominations"]:
+                targets.append((url, product_info, denomination))
+        return plan
+
+    async def check_page(self, url: str, denominations: Tuple[str, ...]) -> Dict[str, Tuple[StockState, str, str]]:
+        """Fetch one page and return (state, status_msg, price) per denomination; failures are UNKNOWN.
+
+        price is "" when the page price cannot be attributed to that denomination.
+        """
         try:
             session = await self.get_session()
-            await asyncio.sleep(2)
-            async with session.get(url, timeout=30, allow_redirects=True) as response:
+            profile = self.profiles.pick()
+            if profile.headers['User-Agent'] != self.session_user_agent:
+                # Cookies issued to one browser fingerprint must not follow another
+                session.cookie_jar.clear()
+                self.session_user_agent = profile.headers['User-Agent']
+            await asyncio.sleep(REQUEST_DELAY)
+            async with session.get(url, headers=profile.headers, timeout=30, allow_redirects=True) as response:
                 if response.status != 200:
-                    return False, f"HTTP Error: {response.status}", ""
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Check denomination
-                denomination_selectors = [
-                    f'select option[value*="{denomination}"]',
-                    f'option:contains("Rs. {denomination}")',
-                    f'option:contains("₹{denomination}")',
-                ]
-                denomination_exists = False
-                for selector in denomination_selectors:
-                    if soup.select_one(selector):
-                        denomination_exists = True
-                        break
-                
-                page_text = soup.get_text()
-                denomination_in_text = f"Rs.{denomination}" in page_text or f"₹{denomination}" in page_text
-                page_text_lower = page_text.lower()
-                is_out_of_stock = any(indicator in page_text_lower for indicator in OUT_OF_STOCK_INDICATORS)
-                buy_box = soup.select_one('#buy-now-button, #add-to-cart-button, .a-button-input')
-                has_buy_button = buy_box is not None and buy_box.get('aria-disabled') != 'true'
-                
-                if denomination_exists or denomination_in_text:
-                    in_stock = has_buy_button and not is_out_of_stock
-                else:
-                    in_stock = False
-                
-                price_element = (soup.select_one('.a-price-whole') or 
-                               soup.select_one('#priceblock_ourprice') or 
-                               soup.select_one('.a-price .a-offscreen'))
-                price = price_element.get_text().strip() if price_element else "Price not visible"
-                
-                availability = soup.select_one('#availability span, .a-color-success, .a-color-error')
-                status_msg = availability.get_text().strip() if availability else "Unknown status"
-                
-                logger.info(f"{product_info['name']} - ₹{denomination}: {'IN STOCK' if in_stock else 'OUT OF STOCK'}")
-                return in_stock, status_msg, price
+                    self.profiles.report(profile, captcha=response.status == 503)
+                    return {d: (StockState.UNKNOWN, f"HTTP Error: {response.status}", "") for d in denominations}
+                raw = await response.read()
+                encoding = response.charset or 'utf-8'
+                final_url = str(response.url)
+            captcha, states, status_msg, price, selected = await self.parse_page(raw, encoding, denominations)
+            self.profiles.report(profile, captcha=captcha)
+            if captcha:
+                logger.warning(f"Captcha served for {url}")
+                return {d: (StockState.UNKNOWN, status_msg, "") for d in denominations}
+            canonical = canonical_product_url(final_url)
+            if canonical is None:
+                # Landed on a homepage, search or interstitial: never merge entries onto it,
+                # and go back to fetching the catalog URLs that pointed here
+                stale = [key for key, (page, _) in self.canonical.items() if key == url or page == url]
+                for key in stale:
+                    del self.canonical[key]
+                if stale or final_url != url:
+                    logger.warning(f"{url} did not resolve to a product page ({final_url})")
+            else:
+                if url not in self.canonical or self.canonical[url][0] != canonical:
+                    logger.info(f"Resolved {url} -> {canonical}")
+                self.canonical[url] = (canonical, time.time())
+            
+            for denomination, state in zip(denominations, states):
+                logger.info(f"{url} - ₹{denomination}: {StockState(state).name}")
+            return {d: (StockState(state), status_msg,
+                        price if d == selected or (not selected and len(denominations) == 1) else "")
+                    for d, state in zip(denominations, states)}
         except Exception as e:
-            logger.error(f"Error checking ₹{denomination}: {str(e)}")
-            return False, f"Error", ""
+            logger.error(f"Error checking {url}: {str(e)}")
+            return {d: (StockState.UNKNOWN, f"Error", "") for d in denominations}
 
     async def close(self):
         if self.session and not self.session.closed:
             await self.session.close()
         if self.connector and not self.connector.closed:
             await self.connector.close()
+        if self.parse_pool:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+
+# ===== WATCHDOG =====
+class LoopWatchdog:
+    """Tracks event-loop lag and sweep timing, and cancels checks that hang"""
+
+    def __init__(self, on_alert):
+        self.on_alert = on_alert
+        self.lags = deque(maxlen=300)
+        self.sweeps = deque(maxlen=50)
+        self.sweep_start: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+        self.last_stages: Dict[str, float] = {}
+        self.in_flight: Dict[asyncio.Task, Tuple[str, float]] = {}
+        self.killed = set()
+        self.stuck_checks = 0
+        self.errors = 0
+        self.last_alert = 0.0
+        # Strong references so pending alert sends are not garbage-collected
+        self.alert_tasks = set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            lag = loop.time() - start - WATCHDOG_INTERVAL
+            self.lags.append(lag)
+            now = time.monotonic()
+            for task, (name, started) in list(self.in_flight.items()):
+                if now - started > STUCK_CHECK_TIMEOUT and task not in self.killed:
+                    logger.warning(f"Watchdog: cancelling stuck check {name} after {now - started:.0f}s")
+                    self.killed.add(task)
+                    self.stuck_checks += 1
+                    task.cancel()
+            if lag > LOOP_LAG_SLO:
+                self.alert(f"Event loop lag {lag:.2f}s (SLO {LOOP_LAG_SLO:.1f}s)")
+            elif self.sweep_start is not None and now - self.sweep_start > SWEEP_SLO * 2:
+                self.alert(f"Sweep running for {now - self.sweep_start:.0f}s (SLO {SWEEP_SLO:.0f}s)")
+
+    def begin_sweep(self):
+        self.sweep_start = time.monotonic()
+        self.stages = {}
+
+    def end_sweep(self):
+        if self.sweep_start is None:
+            return
+        duration = time.monotonic() - self.sweep_start
+        self.sweeps.append(duration)
+        self.last_stages = self.stages
+        self.sweep_start = None
+        if duration > SWEEP_SLO:
+            self.alert(f"Sweep took {duration:.1f}s (SLO {SWEEP_SLO:.0f}s)")
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start
+
+    async def run_check(self, name: str, factory, retries: int = 1):
+        """Run factory() as a tracked task, restarting it if the watchdog cancels it"""
+        for attempt in range(retries + 1):
+            task = asyncio.create_task(factory())
+            self.in_flight[task] = (name, time.monotonic())
+            try:
+                with self.stage(name):
+                    return await task
+            except asyncio.CancelledError:
+                if task not in self.killed:
+                    raise
+                if attempt < retries:
+                    logger.warning(f"Watchdog: restarting {name} (attempt {attempt + 2})")
+            finally:
+                self.in_flight.pop(task, None)
+                self.killed.discard(task)
+        raise asyncio.TimeoutError(f"{name} stuck after {retries + 1} attempts")
+
+    def alert(self, reason: str):
+        """Post a throttled health alert with the slowest stages"""
+        now = time.monotonic()
+        if self.last_alert and now - self.last_alert < HEALTH_ALERT_COOLDOWN:
+            return
+        self.last_alert = now
+        logger.warning(f"Health: {reason}")
+        task = asyncio.get_running_loop().create_task(self.on_alert(self.render(reason)))
+        self.alert_tasks.add(task)
+        task.add_done_callback(self.alert_tasks.discard)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        sweeps = sorted(self.sweeps)
+        return {
+            'last_sweep': self.sweeps[-1] if self.sweeps else None,
+            'p95_sweep': sweeps[int(len(sweeps) * 0.95) - 1] if len(sweeps) >= 20 else (sweeps[-1] if sweeps else None),
+            'max_lag': max(self.lags) if self.lags else 0.0,
+            'stuck_checks': self.stuck_checks,
+            'errors': self.errors,
+            'slowest': sorted(self.last_stages.items(), key=lambda kv: kv[1], reverse=True)[:3],
+            'current': sorted(self.stages.items(), key=lambda kv: kv[1], reverse=True)[:3] if self.sweep_start is not None else [],
+            'in_flight': [(name, now - started) for name, started in self.in_flight.values()],
+        }
+
+    def render(self, reason: str) -> str:
+        snap = self.snapshot()
+        lines = ["⚠️ HEALTH ALERT ⚠️", "", reason, ""]
+        if snap['last_sweep'] is not None:
+            lines.append(f"Last sweep: {snap['last_sweep']:.1f}s (SLO {SWEEP_SLO:.0f}s)")
+        lines.append(f"Max loop lag: {snap['max_lag']:.2f}s")
+        lines.append(f"Stuck checks: {snap['stuck_checks']} | Errors: {snap['errors']}")
+        if snap['in_flight']:
+            lines.append("Running now:")
+            for name, duration in snap['in_flight']:
+                lines.append(f"  • {name}: {duration:.1f}s")
+        if snap['current']:
+            lines.append("Slowest stages this sweep:")
+            for name, duration in snap['current']:
+                lines.append(f"  • {name}: {duration:.1f}s")
+        if snap['slowest']:
+            lines.append("Slowest stages last sweep:")
+            for name, duration in snap['slowest']:
+                lines.append(f"  • {name}: {duration:.1f}s")
+        return "\n".join(lines)
+
+# ===== SUBSCRIPTIONS =====
+class SubscriptionRegistry:
+    """Which chats receive alerts for which denominations, indexed by denomination"""
+
+    def __init__(self, path=SUBSCRIPTIONS_FILE, default_chat: Optional[str] = None):
+        self.path = path
+        self.subscriptions: Dict[str, set] = {}
+        self.by_denom: Dict[str, set] = defaultdict(set)
+        self.load()
+        if not self.subscriptions and default_chat:
+            self.subscribe(default_chat)
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for chat_id, denoms in data.items():
+                    self._add(str(chat_id), denoms)
+        except Exception as e:
+            logger.error(f"Failed to load subscriptions: {e}")
+
+    def save(self):
+        try:
+            data = {chat_id: sorted(denoms) for chat_id, denoms in self.subscriptions.items()}
+            replace_atomically(self.path, json.dumps(data, indent=2).encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Failed to save subscriptions: {e}")
+
+    def _add(self, chat_id: str, denoms):
+        chat_denoms = self.subscriptions.setdefault(chat_id, set())
+        for denom in denoms:
+            chat_denoms.add(denom)
+            self.by_denom[denom].add(chat_id)
+
+    def subscribe(self, chat_id, denominations: Optional[List[str]] = None):
+        """Subscribe a chat to some denominations, or all of them when none are given"""
+        self._add(str(chat_id), denominations or [ALL_DENOMINATIONS])
+        self.save()
+
+    def unsubscribe(self, chat_id, denominations: Optional[List[str]] = None):
+        """Unsubscribe a chat from some denominations, or from everything when none are given"""
+        chat_id = str(chat_id)
+        chat_denoms = self.subscriptions.get(chat_id, set())
+        if denominations and ALL_DENOMINATIONS in chat_denoms:
+            # Narrow a wildcard subscription to every other catalog denomination
+            self._add(chat_id, [d for d in known_denominations() if d not in denominations])
+            chat_denoms.discard(ALL_DENOMINATIONS)
+            self.by_denom[ALL_DENOMINATIONS].discard(chat_id)
+        for denom in list(denominations or chat_denoms):
+            chat_denoms.discard(denom)
+            self.by_denom[denom].discard(chat_id)
+        if not chat_denoms:
+            self.subscriptions.pop(chat_id, None)
+        self.save()
+
+    def chats_for(self, denomination: str) -> set:
+        return self.by_denom.get(denomination, set()) | self.by_denom.get(ALL_DENOMINATIONS, set())
+
+    def all_chats(self) -> List[str]:
+        return list(self.subscriptions)
+
+def known_denominations() -> List[str]:
+    return sorted({d for info in PRODUCTS.values() for d in info['denominations']}, key=int)
+
+def parse_denomination_args(args: List[str]) -> Tuple[List[str], List[str]]:
+    """Split command arguments like "1000", "₹1,000" or "Rs.2000" into (known, invalid)"""
+    known = set(known_denominations())
+    denoms, invalid = [], []
+    for arg in args:
+        value = re.sub(r'^(?:₹|rs\.?)', '', arg.strip().lower()).replace(',', '')
+        if value in known:
+            if value not in denoms:
+                denoms.append(value)
+        else:
+            invalid.append(arg)
+    return denoms, invalid
+
+class AsyncRateLimiter:
+    """Token bucket shared by every send so fan-out stays within Telegram's budget"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
 
 # ===== TELEGRAM BOT =====
 class StockNotificationBot:
     def __init__(self, token: str, chat_id: str):
-        self.bot = Bot(token=token)
+        # The default pool holds one connection, which would serialize the fan-out
+        self.bot = Bot(token=token, request=HTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE, pool_timeout=30))
         self.chat_id = chat_id
         self.checker = AmazonStockChecker()
         self.history = StockHistory()
+        self.prices = PriceStore()
+        self.watchdog = LoopWatchdog(self.send_health_alert)
+        self.watchdog_task = None
+        self.subscriptions = SubscriptionRegistry(default_chat=chat_id)
+        self.rate_limiter = AsyncRateLimiter(TELEGRAM_GLOBAL_RATE)
+        # (chat, denomination) -> (dedup key, time) of the last delivered alert
+        self.delivered: Dict[Tuple[str, str], Tuple[str, float]] = {}
         self.last_alert_time: Dict[str, float] = {}
         self.last_status_change: Dict[str, bool] = {}
         self.last_daily_report = None
+        self.started_at = time.time()
+        self.last_sweep_at: Optional[float] = None
+        # Time spent re-checking suspected flips, reported apart from regular checks
+        self.confirm_checks = 0
+        self.confirm_seconds = 0.0
+        self.commands_task = None
 
     async def send_stock_alert(self, product_name: str, url: str, denomination: str, price: str, in_stock: bool):
         alert_key = f"{url}_{denomination}"
@@ -270,16 +1446,66 @@ class StockNotificationBot:
                 f"Will alert again when restocked."
             )
         
-        try:
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
-                parse_mode='Markdown'
-            )
+        delivered = await self.broadcast(denomination, message, dedup_key=status, parse_mode='Markdown')
+        if delivered:
             # We update the time so the 30-minute timer starts/restarts
             self.last_alert_time[alert_key] = current_time 
+
+    async def send_to_chat(self, chat_id: str, text: str, parse_mode: Optional[str] = None) -> bool:
+        for attempt in range(2):
+            await self.rate_limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Rate limited sending to {chat_id}, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except TelegramError as e:
+                logger.error(f"Failed to send to {chat_id}: {e}")
+                return False
+        return False
+
+    async def broadcast(self, denomination: str, text: str, dedup_key: Optional[str] = None,
+                        parse_mode: Optional[str] = None) -> int:
+        """Send one rendered message to every chat subscribed to the denomination"""
+        now = time.time()
+        targets = []
+        for chat_id in self.subscriptions.chats_for(denomination):
+            last = self.delivered.get((chat_id, denomination))
+            # Skip a chat that already got this exact alert, e.g. from a second listing
+            if dedup_key and last and last[0] == dedup_key and now - last[1] < ALERT_COOLDOWN:
+                continue
+            targets.append(chat_id)
+        if not targets:
+            return 0
+        results = await asyncio.gather(*(self.send_to_chat(chat_id, text, parse_mode) for chat_id in targets))
+        for chat_id, ok in zip(targets, results):
+            if ok and dedup_key:
+                self.delivered[(chat_id, denomination)] = (dedup_key, now)
+        logger.info(f"Delivered ₹{denomination} alert to {sum(results)}/{len(targets)} chats")
+        return sum(results)
+
+    async def send_price_alert(self, product_name: str, url: str, denomination: str, old_price: int, new_price: int):
+        logger.info(f"Price change ₹{denomination}: {format_price(old_price)} -> {format_price(new_price)}")
+        if not PRICE_CHANGE_ALERTS:
+            return
+        arrow = "📈" if new_price > old_price else "📉"
+        message = (
+            f"{arrow} **PRICE CHANGE** {arrow}\n\n"
+            f"**{product_name}**\n\n"
+            f"**VALUE:** **₹{denomination}**\n\n"
+            f"Price: {format_price(old_price)} → {format_price(new_price)}\n"
+            f"{url}\n"
+            f"Time: {iraq_now().strftime('%d/%m/%Y %H:%M:%S')} Iraq"
+        )
+        # Series are per listing, so a change is reported once and listings never alternate
+        await self.broadcast(denomination, message, parse_mode='Markdown')
+
+    async def send_health_alert(self, message: str):
+        try:
+            await self.bot.send_message(chat_id=self.chat_id, text=message)
         except TelegramError as e:
-            logger.error(f"Failed to send: {e}")
+            logger.error(f"Failed to send health alert: {e}")
 
     async def send_daily_report(self, report_type):
         now = iraq_now()
@@ -287,10 +1513,132 @@ class StockNotificationBot:
         summary = self.history.get_daily_summary(today)
         header = "🌙 MIDNIGHT SUMMARY" if report_type == "midnight" else "☀️ NOON SUMMARY"
         message = f"{header}\n\n{summary}"
+        await asyncio.gather(*(self.send_to_chat(chat_id, message) for chat_id in self.subscriptions.all_chats()))
+
+    # ===== COMMANDS =====
+    # Answered from in-memory state only; nothing here fetches from Amazon.
+    async def poll_commands(self):
+        """Long-poll Telegram for commands on the bot's separate get_updates connection"""
+        offset = None
+        # Skip commands queued while the bot was down instead of answering them all at once
         try:
-            await self.bot.send_message(chat_id=self.chat_id, text=message)
+            backlog = await self.bot.get_updates(offset=-1, timeout=0, allowed_updates=['message'])
+            if backlog:
+                offset = backlog[-1].update_id + 1
+                logger.info(f"Dropped queued commands up to update {backlog[-1].update_id}")
         except TelegramError as e:
-            logger.error(f"Failed to send report: {e}")
+            logger.error(f"Could not drop queued commands: {e}")
+        while True:
+            try:
+                updates = await self.bot.get_updates(offset=offset, timeout=COMMAND_POLL_TIMEOUT,
+                                                     allowed_updates=['message'])
+            except TelegramError as e:
+                logger.error(f"Command polling failed: {e}")
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                message = update.message
+                if message and message.text and message.text.startswith('/'):
+                    try:
+                        await self.handle_command(str(message.chat_id), message.text)
+                    except Exception:
+                        logger.exception(f"Command failed: {message.text}")
+
+    async def handle_command(self, chat_id: str, text: str):
+        parts = text.split()
+        command = parts[0].split('@')[0].lower()
+        args = parts[1:]
+        if command == '/status':
+            reply = self.render_status()
+        elif command == '/history':
+            hours = int(args[0]) if args and args[0].isdigit() else 12
+            hours = max(1, min(hours, HISTORY_RETENTION_DAYS * 24))
+            reply = f"📊 {hours}-HOUR HISTORY\n━━━━━━━━━━━━━━━━━━━━\n\n{self.history.get_window_summary(hours)}"
+        elif command == '/stats':
+            reply = self.render_stats()
+        elif command == '/health':
+            reply = self.render_health()
+        elif command in ('/subscribe', '/unsubscribe'):
+            denoms, invalid = parse_denomination_args(args)
+            if invalid:
+                known = known_denominations()
+                reply = (
+                    f"❌ Unknown denomination: {', '.join(invalid)}\n\n"
+                    f"Usage: {command} [{' '.join(known)}]\n"
+                    f"Without arguments: {'all denominations' if command == '/subscribe' else 'stop all alerts'}"
+                )
+            elif command == '/subscribe':
+                self.subscriptions.subscribe(chat_id, denoms or None)
+                reply = f"✅ Subscribed to {', '.join('₹' + d for d in denoms) if denoms else 'all denominations'}"
+            else:
+                self.subscriptions.unsubscribe(chat_id, denoms or None)
+                reply = f"✅ Unsubscribed from {', '.join('₹' + d for d in denoms) if denoms else 'all alerts'}"
+                remaining = sorted(self.subscriptions.subscriptions.get(chat_id, set()), key=int)
+                reply += f"\nStill subscribed to: {', '.join('₹' + d for d in remaining) if remaining else 'nothing'}"
+        elif command in ('/start', '/help'):
+            reply = (
+                "🤖 Commands\n\n"
+                "/status - current stock status\n"
+                "/history [hours] - events in the last N hours\n"
+                "/stats - today's summary and prices\n"
+                "/health - monitor health\n"
+                "/subscribe [1000 2000 ...] - get alerts\n"
+                "/unsubscribe [1000 ...] - stop alerts"
+            )
+        else:
+            return
+        await self.send_to_chat(chat_id, reply)
+
+    def render_status(self) -> str:
+        by_denom: Dict[str, bool] = {}
+        for statuses in self.checker.last_status.values():
+            for denom, (in_stock, _) in statuses.items():
+                by_denom[denom] = by_denom.get(denom, False) or in_stock
+        lines = ["📡 CURRENT STATUS", "━━━━━━━━━━━━━━━━━━━━"]
+        for denom in sorted(by_denom, key=int):
+            emoji = "🟢" if by_denom[denom] else "🔴"
+            state = "IN STOCK" if by_denom[denom] else "OUT OF STOCK"
+            price = self.prices.latest_price(denom)
+            price_str = f" ({format_price(price)})" if price is not None else ""
+            lines.append(f"{emoji} ₹{denom} - {state}{price_str}")
+        if self.last_sweep_at:
+            lines.append("")
+            lines.append(f"Last check: {iraq_time(int(self.last_sweep_at)).strftime('%H:%M:%S')} Iraq")
+        return "\n".join(lines)
+
+    def render_stats(self) -> str:
+        lines = [self.history.get_daily_summary()]
+        price_lines = []
+        for denom in self.prices.denominations():
+            rows = self.prices.trend(denom, 'hour', 86400)
+            if rows:
+                low = min(r[1] for r in rows)
+                high = max(r[2] for r in rows)
+                price_lines.append(f"  ₹{denom}: {format_price(low)} - {format_price(high)}")
+        if price_lines:
+            lines.append("")
+            lines.append("💰 Prices (24h low - high):")
+            lines.extend(price_lines)
+        return "\n".join(lines)
+
+    def render_health(self) -> str:
+        snap = self.watchdog.snapshot()
+        writer = self.history.writer.metrics()
+        uptime = int(time.time() - self.started_at)
+        profiles = self.checker.profiles.profiles
+        lines = ["🩺 HEALTH", "━━━━━━━━━━━━━━━━━━━━"]
+        lines.append(f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m")
+        if snap['last_sweep'] is not None:
+            lines.append(f"Last sweep: {snap['last_sweep']:.1f}s | p95: {snap['p95_sweep']:.1f}s (SLO {SWEEP_SLO:.0f}s)")
+        lines.append(f"Max loop lag: {snap['max_lag']:.2f}s")
+        lines.append(f"Stuck checks: {snap['stuck_checks']} | Errors: {snap['errors']}")
+        lines.append(f"History writes: {writer['flushes']} (avg {writer['avg_ms']}ms, max {writer['max_ms']}ms)")
+        unknowns = sum(tracker.unknowns for tracker in self.checker.trackers.values())
+        lines.append(f"Unusable samples: {unknowns} | Confirmation re-checks: {self.confirm_checks}")
+        lines.append(f"Header profiles: {len(profiles)} (avg score {sum(p.score for p in profiles) / len(profiles):.2f})")
+        lines.append(f"Subscribed chats: {len(self.subscriptions.all_chats())}")
+        return "\n".join(lines)
 
     async def check_daily_report_time(self):
         now = iraq_now()
@@ -320,32 +1668,106 @@ class StockNotificationBot:
                 for denom in product_info["denominations"]:
                     self.checker.last_status[url][denom] = (False, "")
         
+        if self.watchdog_task is None:
+            self.watchdog_task = asyncio.create_task(self.watchdog.run())
+        
         while True:
             try:
-                for url, product_info in PRODUCTS.items():
-                    for denomination in product_info["denominations"]:
-                        logger.info(f"Checking ₹{denomination}...")
-                        in_stock, status_msg, price = await self.checker.check_denomination_stock(url, denomination, product_info)
-                        prev_in_stock, _ = self.checker.last_status[url].get(denomination, (False, ""))
-                        
-                        if in_stock != prev_in_stock:
-                            logger.info(f"Status change: ₹{denomination}: {prev_in_stock} -> {in_stock}")
-                            await self.send_stock_alert(product_info['name'], url, denomination, price, in_stock)
-                        
-                        self.checker.last_status[url][denomination] = (in_stock, status_msg)
-                        await asyncio.sleep(3)
+                self.watchdog.begin_sweep()
+                for fetch_url, targets in self.checker.build_fetch_plan(PRODUCTS).items():
+                    denominations = tuple(dict.fromkeys(denomination for _, _, denomination in targets))
+                    logger.info(f"Checking {fetch_url} for ₹{', ₹'.join(denominations)}...")
+                    # A suspected flip is re-checked right away until confirmed or dismissed
+                    confirm_from = None
+                    for attempt in range(MAX_CONFIRM_CHECKS + 1):
+                        if attempt:
+                            await asyncio.sleep(CONFIRM_DELAY)
+                            self.confirm_checks += 1
+                            logger.info(f"Confirming suspected change on {fetch_url} ({attempt}/{MAX_CONFIRM_CHECKS})")
+                        try:
+                            results = await self.watchdog.run_check(
+                                fetch_url,
+                                lambda: self.checker.check_page(fetch_url, denominations))
+                        except asyncio.TimeoutError as e:
+                            # Keep the previous status rather than alerting on a hung check
+                            logger.error(f"Skipping {fetch_url}: {e}")
+                            break
+                        # Re-checks only confirm status; one price sample per page per sweep
+                        pending = await self.apply_results(targets, results, record_prices=not attempt)
+                        if not attempt:
+                            confirm_from = time.monotonic()
+                        if not pending:
+                            break
+                        if attempt and all(state == StockState.UNKNOWN for state, _, _ in results.values()):
+                            # Captcha or error on a re-check: back off, the next sweep carries on
+                            logger.info(f"Re-check of {fetch_url} failed, confirming on the next sweep")
+                            break
+                    if confirm_from is not None:
+                        self.confirm_seconds += time.monotonic() - confirm_from
+                    await asyncio.sleep(PAGE_SPACING)
                 
+                self.watchdog.end_sweep()
+                self.last_sweep_at = time.time()
                 await self.check_daily_report_time()
                 await asyncio.sleep(CHECK_INTERVAL)
-            except Exception as e:
-                logger.error(f"Error: {e}")
+            except Exception:
+                self.watchdog.errors += 1
+                logger.exception("Monitor sweep failed")
                 await asyncio.sleep(60)
 
+    async def apply_results(self, targets: List[Tuple[str, dict, str]], results: Dict[str, Tuple[StockState, str, str]],
+                            record_prices: bool = True) -> bool:
+        """Map one page result back to every catalog entry; returns True while a flip is unconfirmed"""
+        pending = False
+        priced = set()
+        # Catalog entries merged onto one page flip together; report each change once
+        alerted = set()
+        for url, product_info, denomination in targets:
+            state, status_msg, price = results[denomination]
+            tracker = self.checker.trackers.get((url, denomination))
+            if tracker is None:
+                prev_in_stock, _ = self.checker.last_status[url].get(denomination, (False, ""))
+                tracker = self.checker.trackers[(url, denomination)] = StockTracker(prev_in_stock)
+            if state == StockState.UNKNOWN:
+                logger.info(f"No usable result for ₹{denomination} ({status_msg})")
+            elif record_prices and price and denomination not in priced:
+                priced.add(denomination)
+                price_paise = parse_price_paise(price)
+                listing = self.checker.canonical.get(url, (url, 0))[0]
+                previous_price = self.prices.record(denomination, price_paise, listing)
+                if previous_price is not None:
+                    await self.send_price_alert(product_info['name'], url, denomination, previous_price, price_paise)
+            
+            prev_in_stock = tracker.confirmed
+            flipped = tracker.observe(state)
+            if flipped is not None and (denomination, flipped) not in alerted:
+                alerted.add((denomination, flipped))
+                logger.info(f"Status change: ₹{denomination}: {prev_in_stock} -> {flipped}")
+                with self.watchdog.stage("telegram"):
+                    await self.send_stock_alert(product_info['name'], url, denomination, price or "Price not visible", flipped)
+            pending = pending or tracker.pending
+            
+            if state != StockState.UNKNOWN:
+                self.checker.last_status[url][denomination] = (tracker.confirmed, status_msg)
+        return pending
+
     async def cleanup(self):
+        if self.watchdog_task:
+            self.watchdog_task.cancel()
+        if self.commands_task:
+            self.commands_task.cancel()
         await self.checker.close()
+        await asyncio.to_thread(self.history.close, 30)
+        await asyncio.to_thread(self.prices.close, 30)
 
 async def main():
     bot = StockNotificationBot(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID)
+    # The platform stops the bot with SIGTERM; cancel so cleanup flushes the writers
+    main_task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    except NotImplementedError:
+        pass
     try:
         me = await bot.bot.get_me()
         logger.info(f"Bot connected: @{me.username}")
@@ -356,7 +1778,10 @@ async def main():
             f"Time: {now.strftime('%d/%m/%Y %I:%M %p')} Iraq"
         )
         await bot.bot.send_message(chat_id=bot.chat_id, text=startup_message)
+        bot.commands_task = asyncio.create_task(bot.poll_commands())
         await bot.monitor_products()
+    except asyncio.CancelledError:
+        logger.info("Shutdown requested, flushing history and prices")
     except Exception as e:
         logger.error(f"Fatal error: {e}")
     finally:
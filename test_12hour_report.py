@@ -1,10 +1,11 @@
 import asyncio
-import json
 from datetime import datetime, timedelta, timezone
 from telegram import Bot
 from telegram.error import TelegramError
 import os
 
+from main import StockHistory
+
 TELEGRAM_BOT_TOKEN = "8649783060:AAG2EvOnFL1C8nPLjqLfi1k-OQF_NyHTkwY"
 GROUP_CHAT_ID = "-1003891147099"
 
@@ -45,33 +46,14 @@ async def send_12hour_report():
             print(f"❌ Error: {e}")
         return
     
-    # Load history
+    # Load history; counts come from the running hourly aggregates
     try:
-        with open(history_file, 'r') as f:
-            events = json.load(f)
+        history = StockHistory(history_file)
     except Exception as e:
         message = f"❌ Error reading history file: {str(e)}"
         await bot.send_message(chat_id=GROUP_CHAT_ID, text=message)
         return
     
-    # Filter last 12 hours using Iraq time
-    cutoff = now - timedelta(hours=12)
-    
-    recent_events = []
-    for event in events:
-        try:
-            # Convert stored time to Iraq time for comparison
-            event_time = datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
-            event_time_iraq = event_time.replace(tzinfo=timezone.utc) + timedelta(hours=3)
-            if event_time_iraq > cutoff:
-                recent_events.append(event)
-        except:
-            continue
-    
-    # Count by status
-    in_stock_count = sum(1 for e in recent_events if e.get('status') == 'IN_STOCK')
-    out_stock_count = sum(1 for e in recent_events if e.get('status') == 'OUT_STOCK')
-    
     # Build message
     lines = []
     lines.append("📊 12-HOUR HISTORY REPORT")
@@ -79,47 +61,7 @@ async def send_12hour_report():
     lines.append(f"⏱️ Period: {(now - timedelta(hours=12)).strftime('%H:%M')} → {now.strftime('%H:%M')} Iraq Time")
     lines.append(f"📅 Date: {now.strftime('%d/%m/%Y')}")
     lines.append("━━━━━━━━━━━━━━━━━━━━\n")
-    
-    if not recent_events:
-        lines.append("📭 No activity in the last 12 hours")
-        lines.append("")
-        lines.append("✓ Bot is running")
-        lines.append("✓ Checking every 2 minutes")
-        lines.append("✓ Waiting for stock")
-    else:
-        lines.append("📊 SUMMARY")
-        lines.append(f"  🟢 IN STOCK: {in_stock_count}")
-        lines.append(f"  🔴 OUT STOCK: {out_stock_count}")
-        lines.append(f"  📊 Total events: {len(recent_events)}\n")
-        
-        lines.append("📋 DETAILS BY DENOMINATION")
-        
-        # Group by denomination
-        from collections import defaultdict
-        by_denom = defaultdict(list)
-        for e in recent_events:
-            denom = e.get('denomination', 'Unknown')
-            by_denom[denom].append(e)
-        
-        for denom in sorted(by_denom.keys(), key=lambda x: int(x) if x.isdigit() else 0):
-            events = by_denom[denom]
-            in_count = sum(1 for e in events if e.get('status') == 'IN_STOCK')
-            out_count = sum(1 for e in events if e.get('status') == 'OUT_STOCK')
-            
-            lines.append(f"")
-            lines.append(f"  ₹{denom}:")
-            lines.append(f"    🟢 IN: {in_count} | 🔴 OUT: {out_count}")
-            
-            # Show last 3 events
-            for event in events[-3:]:
-                try:
-                    event_time = datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
-                    event_time_iraq = event_time.replace(tzinfo=timezone.utc) + timedelta(hours=3)
-                    time_str = event_time_iraq.strftime('%H:%M')
-                except:
-                    time_str = event.get('time', 'Unknown')
-                emoji = "🟢" if event.get('status') == 'IN_STOCK' else "🔴"
-                lines.append(f"    {emoji} {time_str} - {event.get('status', 'Unknown')}")
+    lines.append(history.get_window_summary(12))
     
     lines.append("")
     lines.append("━━━━━━━━━━━━━━━━━━━━")
@@ -135,7 +77,6 @@ async def send_12hour_report():
             text=message
         )
         print("✅ 12-hour report sent successfully!")
-        print(f"📊 Events in last 12 hours: {len(recent_events)}")
     except TelegramError as e:
         print(f"❌ Error sending report: {e}")
 